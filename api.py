@@ -1,7 +1,8 @@
 import json
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import asyncio
 from typing import List, Dict
@@ -9,11 +10,19 @@ from fastapi.middleware.cors import CORSMiddleware
 
 
 # Import the agent and config we've already built
-from app.my_agents import master_agent
+from app.my_agents import master_agent, build_run_context, usage_summary
+from app.my_faq_cache import get_cached_answer, maybe_cache_answer
+from app.my_functions import load_bookings, add_availability_listener, check_for_data_changes
+from app.my_push import AvailabilityHub, AVAILABILITY_CHANNEL
+from app.my_prefetch import speculative_prefetch
+from app.my_bookings import configure_booking_store
+from app.my_tenants import DEFAULT_HOSPITAL_ID, UnknownTenant, discover_tenants, get_tenant, session_key, use_tenant
+from app.my_concurrency import (AdmissionRejected, EventLoopLagMonitor, RunGovernor, SessionLocks, MAX_IN_FLIGHT_RUNS, MAX_QUEUED_RUNS, RUN_QUEUE_TIMEOUT_SECONDS)
 from geminiConfig import gemini_config
 from agents import Runner, set_trace_processors, set_tracing_export_api_key, trace
 from agents.tracing.processors import default_processor
 import redis # <--- IMPORT THE NEW LIBRARY
+import redis.asyncio as aioredis
 
 
 try:
@@ -38,6 +47,41 @@ except Exception as e:
     api_key = os.getenv("OPENAI_API_KEY")
     set_tracing_export_api_key(api_key)
 
+# --- Booking storage ---
+# With BOOKINGS_BACKEND=redis, bookings live on this same Redis instance so every
+# replica shares one ledger (token numbers are allocated atomically in Redis).
+if redis_client:
+    configure_booking_store(redis_client)
+
+# --- Admission control ---
+# A global cap on concurrent agent runs (with a bounded wait queue) plus a
+# per-session lock so two messages for the same session never race on history.
+run_governor = RunGovernor(MAX_IN_FLIGHT_RUNS, MAX_QUEUED_RUNS, RUN_QUEUE_TIMEOUT_SECONDS)
+session_locks = SessionLocks(redis_client)
+loop_lag_monitor = EventLoopLagMonitor()
+
+# --- Availability push ---
+# Bookings and cancellations are published on Redis so subscribers on every
+# replica hear about them. Schedule/absence reloads are detected by each
+# replica's own file watcher, so those are only dispatched locally.
+availability_hub = AvailabilityHub()
+DATA_WATCH_INTERVAL_SECONDS = float(os.getenv("DATA_WATCH_INTERVAL_SECONDS", "5"))
+_main_loop = None
+_background_tasks = set()
+
+def _publish_availability_event(event: dict):
+    if redis_client and event["reason"] != "reload":
+        try:
+            redis_client.publish(AVAILABILITY_CHANNEL, json.dumps(event))
+            return
+        except Exception as e:
+            print(f"[PUSH] Could not publish to Redis, notifying local subscribers only: {e}")
+    if _main_loop:
+        # May be called from a worker thread, so hand the dispatch to the event loop.
+        asyncio.run_coroutine_threadsafe(availability_hub.dispatch(event), _main_loop)
+
+add_availability_listener(_publish_availability_event)
+
 # --- Step 1: Create our in-memory session storage ---
 # This is a simple dictionary that will hold the history for each session.
 # In a production application, this would be replaced with a real database like Redis.
@@ -59,7 +103,50 @@ app.add_middleware(
 class ChatRequest(BaseModel):
     prompt: str
     session_id: str
+    hospital_id: str = DEFAULT_HOSPITAL_ID  # Which hospital branch this chat is for
     
+@app.on_event("startup")
+async def start_background_tasks():
+    global _main_loop
+    _main_loop = asyncio.get_running_loop()
+    _background_tasks.add(asyncio.create_task(_watch_data_files()))
+    _background_tasks.add(asyncio.create_task(loop_lag_monitor.run()))
+    if redis_client:
+        _background_tasks.add(asyncio.create_task(_relay_availability_events()))
+
+async def _watch_data_files():
+    """Periodically checks every hospital's schedule and absence files for edits."""
+    while True:
+        await asyncio.sleep(DATA_WATCH_INTERVAL_SECONDS)
+        for tenant in discover_tenants().values():
+            with use_tenant(tenant):
+                check_for_data_changes()
+
+async def _relay_availability_events():
+    """Receives availability events published by any replica and pushes them to this worker's subscribers."""
+    # One client for the life of the relay; each reconnect only opens a new pubsub, closed when it fails.
+    pubsub_client = aioredis.Redis(
+        host=os.getenv("REDIS_HOST"),
+        port=int(os.getenv("REDIS_PORT")),
+        password=os.getenv("REDIS_PASSWORD"),
+        decode_responses=True
+    )
+    try:
+        while True:
+            pubsub = pubsub_client.pubsub()
+            try:
+                await pubsub.subscribe(AVAILABILITY_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await availability_hub.dispatch(json.loads(message["data"]))
+            except Exception as e:
+                print(f"[PUSH] Availability relay error, reconnecting: {e}")
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.aclose()
+    finally:
+        await pubsub_client.aclose()
+
 # Create a simple root endpoint to confirm the server is running
 @app.get("/")
 def read_root():
@@ -76,47 +163,111 @@ async def chat_with_agent(request: ChatRequest):
     if not redis_client:
         return {"error": "Redis connection not available. Please check server configuration."}
 
-    print(f"\nReceived prompt: '{request.prompt}' for session: {request.session_id}")
-    
-    # Get the history for this session, or create an empty list if it's a new session
-    history_json = redis_client.get(request.session_id)
-    history = json.loads(history_json) if history_json else []
-    
-    
-    # Append the user's new message to the history
-    history.append({"role": "user", "content": request.prompt})
+    print(f"\nReceived prompt: '{request.prompt}' for session: {request.session_id} (hospital: {request.hospital_id})")
 
     try:
-        # Run the agent with the FULL conversation history
-        with trace("Healthline AI - API"):
-            result = await Runner.run(
-                starting_agent=master_agent,
-                input=history,
-                run_config=gemini_config,
-            )
+        tenant = get_tenant(request.hospital_id)
+    except UnknownTenant as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    history_key = session_key(tenant.hospital_id, request.session_id)
 
-        # Append the agent's response to the history
-        if result.final_output:
-            history.append({"role": "assistant", "content": result.final_output})
+    try:
+        # Everything below - including the agent's tool calls - only sees this hospital's data.
+        with use_tenant(tenant):
+            return await _handle_chat_turn(request, history_key)
+
+    except AdmissionRejected as e:
+        print(f"Request shed ({e.status_code}) for session {history_key}: {e.message}")
+        return JSONResponse(status_code=e.status_code, content={"error": e.message}, headers={"Retry-After": str(e.retry_after)})
 
-        # Save the updated history back to our session store
-        redis_client.set(request.session_id, json.dumps(history), ex=86400)
-        
-        print(f"Agent response: {result.final_output}")
-        return {"response": result.final_output}
-    
     except Exception as e:
         print(f"An error occurred in the agent runner: {e}")
         return {"error": "An internal error occurred. Please try again."}
 
+async def _handle_chat_turn(request: ChatRequest, history_key: str) -> dict:
+    """Runs one chat turn for a session; the caller has already scoped the tenant."""
+    async with session_locks.hold(history_key):
+        # History is read only after we own the session, so a turn never overwrites another.
+        history_json = redis_client.get(history_key)
+        history = json.loads(history_json) if history_json else []
+
+        # Append the user's new message to the history
+        history.append({"role": "user", "content": request.prompt})
+
+        # Repeated general questions are answered straight from the FAQ cache.
+        answer = get_cached_answer(redis_client, request.prompt, history)
+        if answer:
+            print("[FAQ-CACHE] Hit, skipping agent run.")
+        else:
+            async with run_governor.slot():
+                # Slot data for doctors/specialties named in the prompt is computed
+                # while the model works on its first turn.
+                with speculative_prefetch(request.prompt), trace("Healthline AI - API"):
+                    # Run the agent with the FULL conversation history
+                    result = await Runner.run(
+                        starting_agent=master_agent,
+                        # The run context is sent every turn but never stored in history.
+                        input=[build_run_context()] + history,
+                        run_config=gemini_config,
+                    )
+            print(f"[USAGE] {usage_summary(result)}")
+            maybe_cache_answer(redis_client, request.prompt, history, result)
+            answer = result.final_output
+
+        # Append the agent's response to the history
+        if answer:
+            history.append({"role": "assistant", "content": answer})
+
+        # Save the updated history back to our session store
+        redis_client.set(history_key, json.dumps(history), ex=86400)
+
+    print(f"Agent response: {answer}")
+    return {"response": answer}
+
+@app.get("/chat/stats")
+def chat_stats():
+    """Reports in-flight and queued agent runs and event loop lag on this worker."""
+    return {**run_governor.stats(), **loop_lag_monitor.stats()}
+
+@app.websocket("/ws/availability")
+async def availability_updates(websocket: WebSocket, hospital_id: str = DEFAULT_HOSPITAL_ID):
+    """
+    Live availability push channel. After connecting, send
+    {"doctors": [...], "specialties": [...]} to subscribe (send again to change it).
+    The server replies with a full snapshot, then pushes capacity changes as they happen.
+    """
+    await websocket.accept()
+    try:
+        get_tenant(hospital_id)
+    except UnknownTenant as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close(code=1008)
+        return
+
+    try:
+        while True:
+            request = await websocket.receive_json()
+            await availability_hub.subscribe(
+                websocket,
+                hospital_id,
+                [str(name) for name in request.get("doctors", [])],
+                [str(specialty) for specialty in request.get("specialties", [])],
+            )
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[PUSH] Closing availability socket: {e}")
+    finally:
+        availability_hub.unsubscribe(websocket)
+
 @app.get("/view-bookings-secret")
-def view_bookings():
+def view_bookings(hospital_id: str = DEFAULT_HOSPITAL_ID):
     """
-    A temporary, non-production endpoint to view the live bookings.json file.
+    A temporary, non-production endpoint to view a hospital's live bookings.
     """
     try:
-        with open("bookings.json", 'r') as f:
-            bookings = json.load(f)
+        with use_tenant(get_tenant(hospital_id)):
+            bookings = load_bookings()
         return {"bookings": bookings}
     except Exception as e:
         return {"error": str(e)}
\ No newline at end of file
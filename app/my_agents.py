@@ -1,4 +1,3 @@
-from datetime import datetime
 from agents import Agent
 from pydantic import Field, BaseModel
 from geminiConfig import model, gemini_config
@@ -7,6 +6,7 @@ from geminiConfig import model, gemini_config
 from .my_tools import (
     find_slots_by_doctor_name,
     find_slots_by_specialty,
+    find_slots_for_doctors_and_specialties,
     book_appointment,
     find_booking_by_id,
     find_booking_by_phone,
@@ -14,6 +14,7 @@ from .my_tools import (
     get_general_hospital_info,
     list_available_specialties
 )
+from .my_functions import hospital_now, get_hospital_profile, HOSPITAL_TIMEZONE
 
 # === SPECIALIST AGENT DEFINITIONS ===
 
@@ -57,11 +58,14 @@ matcher_tool = specialty_matcher_agent.as_tool(
 )
 
 # === MASTER AGENT DEFINITION ===
-MASTER_AGENT_INSTRUCTIONS = f"""
-You are "HealthLine AI," the orchestrator agent for Fatima Hospital. Your job is to manage the conversation and delegate tasks to your tools according to a strict workflow.
+# NOTE: These instructions must stay byte-for-byte identical between requests so
+# the provider can cache them as a prompt prefix. Anything that changes per day
+# or per session belongs in `build_run_context()` below, never in this string.
+MASTER_AGENT_INSTRUCTIONS = """
+You are "HealthLine AI," the orchestrator agent for the hospital named in the "RUN CONTEXT" message. Your job is to manage the conversation and delegate tasks to your tools according to a strict workflow.
 
 **--- CORE DIRECTIVES ---**
-1.  **REALITY CHECK:** Today's date is {datetime.now().strftime('%A, %Y-%m-%d')}.
+1.  **REALITY CHECK:** Today's date is given in the "RUN CONTEXT" message at the start of the conversation. Treat it as the truth for every date calculation.
 2.  **TOOL RELIANCE:** You are forbidden from answering from your own knowledge. You MUST use tools.
 
 **--- WORKFLOW STATE MACHINE ---**
@@ -79,7 +83,8 @@ This is a mandatory, multi-step process. You MUST follow these steps in order:
     i. First, call `list_available_specialties` to get the official list.
     ii. Second, call `match_specialty_to_hospital_list` with the user's term and the official list.
     iii. Finally, call `find_slots_by_specialty` with the clean name returned by the matcher tool.
-- **IF** a search for slots returns nothing, inform the user and provide the contact number for help: 021-32226631.
+- **IF** the user asks about MORE THAN ONE doctor and/or specialty in the same message (e.g., "is Dr. Amin or Dr. Farheen free, or any cardiologist?"), make ONE call to `find_slots_for_doctors_and_specialties` with all the doctor names and specialties instead of separate searches. Match specialty terms with the sub-routine above first.
+- **IF** a search for slots returns nothing, inform the user and provide the appointment helpline from the "RUN CONTEXT" message.
 - **IF** you find slots, list them and ask the user to choose.
 
 **STATE 2 & 3: BOOKING & CANCELLATION** (These are stable)
@@ -93,6 +98,7 @@ master_agent = Agent(
         # The two new, unambiguous search tools
         find_slots_by_doctor_name,
         find_slots_by_specialty,
+        find_slots_for_doctors_and_specialties,
         
         # Core functionality tools
         book_appointment,
@@ -106,4 +112,40 @@ master_agent = Agent(
         symptom_tool,
         matcher_tool
     ]
-)
\ No newline at end of file
+)
+
+
+def build_run_context() -> dict:
+    """
+    Builds the small, per-run context message that is placed in front of the
+    conversation history. It holds everything that must NOT live in the static
+    instructions (hospital, helpline, today's date, timezone), and is only
+    stable for a day, so it sits after the cacheable prefix.
+    """
+    now = hospital_now()
+    profile = get_hospital_profile()
+    lines = [
+        "RUN CONTEXT",
+        f"- Hospital: {profile['hospital_name']} (id: {profile['hospital_id']})",
+        f"- Appointment helpline: {profile['appointment_helpline']}",
+        f"- Today's date: {now.strftime('%A, %Y-%m-%d')}",
+        f"- Hospital timezone: {HOSPITAL_TIMEZONE}",
+    ]
+    return {"role": "system", "content": "\n".join(lines)}
+
+
+def usage_summary(result) -> dict:
+    """
+    Collects token usage for a finished run, including how many prompt tokens
+    the provider served from its prefix cache.
+    """
+    usage = result.context_wrapper.usage
+    input_details = getattr(usage, "input_tokens_details", None)
+    cached_tokens = getattr(input_details, "cached_tokens", 0) or 0
+    return {
+        "model_requests": usage.requests,
+        "input_tokens": usage.input_tokens,
+        "cached_input_tokens": cached_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_hit_ratio": round(cached_tokens / usage.input_tokens, 3) if usage.input_tokens else 0.0,
+    }
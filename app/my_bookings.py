@@ -0,0 +1,259 @@
+# app/my_bookings.py
+
+import json
+import os
+import threading
+from .my_tenants import current_tenant
+
+
+# --- Booking storage backends ---
+# "file"  : the original bookings.json per hospital (single process only).
+# "redis" : shared state on the Redis instance the API already uses, safe with
+#           many API replicas. Select with BOOKINGS_BACKEND=redis.
+BOOKINGS_BACKEND = os.getenv("BOOKINGS_BACKEND", "file")
+DAILY_TOKEN_LIMIT = 20  # Maximum bookings per doctor per day
+
+
+class FileBookingStore:
+    """Bookings kept in the current hospital's bookings.json file."""
+
+    def __init__(self):
+        # Tools run on a thread pool; read-modify-write of the file must not interleave.
+        self._write_lock = threading.Lock()
+
+    def all(self) -> list:
+        try:
+            with open(current_tenant().bookings_file, 'r') as f:
+                # Handle empty file case
+                content = f.read()
+                if content:
+                    return json.loads(content)
+                return []
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _save(self, bookings: list):
+        # Write a temp file and swap it in, so readers on other threads never see a half-written file.
+        bookings_file = current_tenant().bookings_file
+        tmp_file = f"{bookings_file}.tmp.{os.getpid()}"
+        with open(tmp_file, 'w') as f:
+            json.dump(bookings, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, bookings_file)
+
+    def find_by_phone(self, phone_number: str) -> list:
+        return [b for b in self.all() if b.get('patient_phone') == phone_number]
+
+    def find_by_id(self, appointment_id: str) -> list:
+        return [b for b in self.all() if b.get('appointment_id') == appointment_id]
+
+    def count_bookings(self, doctor_dates: list) -> dict:
+        """Returns {(doctor_name, date): number_of_bookings} for the requested pairs."""
+        wanted = set(doctor_dates)
+        counts = dict.fromkeys(wanted, 0)
+        for booking in self.all():
+            key = (booking.get('doctor_name'), booking.get('booking_date'))
+            if key in wanted:
+                counts[key] += 1
+        return counts
+
+    def create(self, booking: dict, daily_limit: int = DAILY_TOKEN_LIMIT):
+        """Assigns the next token and saves the booking. Returns None if the day is full."""
+        with self._write_lock:
+            return self._create(booking, daily_limit)
+
+    def _create(self, booking: dict, daily_limit: int):
+        all_bookings = self.all()
+        bookings_today = [
+            b for b in all_bookings
+            if b.get('doctor_name') == booking['doctor_name'] and b.get('booking_date') == booking['booking_date']
+        ]
+        if len(bookings_today) >= daily_limit:
+            return None
+        # Lowest token not held by a booking, so a cancelled token is handed out again.
+        taken = {b.get('token_number') for b in bookings_today}
+        token_number = next(t for t in range(1, daily_limit + 1) if t not in taken)
+
+        booking = dict(booking, token_number=token_number)
+        all_bookings.append(booking)
+        self._save(all_bookings)
+        return booking
+
+    def cancel(self, appointment_id: str) -> bool:
+        with self._write_lock:
+            return self._cancel(appointment_id)
+
+    def _cancel(self, appointment_id: str) -> bool:
+        all_bookings = self.all()
+        remaining = [b for b in all_bookings if b.get('appointment_id') != appointment_id]
+        if len(remaining) == len(all_bookings):
+            return False # Booking ID not found
+        try:
+            self._save(remaining)
+            return True
+        except Exception as e:
+            print(f"Error writing bookings file during cancellation: {e}")
+            return False
+
+
+# Capacity check, token allocation and all index updates happen in one script,
+# so concurrent bookings on different replicas can never share a token or overbook.
+# The lowest free token in 1..limit is used, like the file store does.
+_CREATE_BOOKING_LUA = """
+local limit = tonumber(ARGV[1])
+if redis.call('SCARD', KEYS[1]) >= limit then
+    return 0
+end
+local token = 0
+for candidate = 1, limit do
+    if redis.call('SISMEMBER', KEYS[2], candidate) == 0 then
+        token = candidate
+        break
+    end
+end
+if token == 0 then
+    return 0
+end
+local booking = cjson.decode(ARGV[3])
+booking['token_number'] = token
+redis.call('SADD', KEYS[2], token)
+redis.call('SET', KEYS[3], cjson.encode(booking))
+redis.call('SADD', KEYS[1], ARGV[2])
+redis.call('SADD', KEYS[4], ARGV[2])
+redis.call('SADD', KEYS[5], ARGV[2])
+return token
+"""
+
+_CANCEL_BOOKING_LUA = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return 0
+end
+local booking = cjson.decode(raw)
+redis.call('DEL', KEYS[1])
+redis.call('SREM', KEYS[2], ARGV[1])
+redis.call('SREM', KEYS[3], ARGV[1])
+redis.call('SREM', KEYS[4], ARGV[1])
+if booking['token_number'] then
+    redis.call('SREM', KEYS[5], booking['token_number'])
+end
+return 1
+"""
+
+
+class RedisBookingStore:
+    """
+    Bookings kept in Redis, per hospital:
+      bookings:{id}:appt:<appointment_id>      -> booking JSON
+      bookings:{id}:all                         -> set of appointment IDs
+      bookings:{id}:phone:<phone>               -> set of appointment IDs
+      bookings:{id}:day:<doctor>:<date>         -> set of appointment IDs (capacity)
+      bookings:{id}:tokens:<doctor>:<date>      -> set of token numbers in use
+    The hospital id is wrapped in {} so one hospital's keys share a cluster slot.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._create_script = redis_client.register_script(_CREATE_BOOKING_LUA)
+        self._cancel_script = redis_client.register_script(_CANCEL_BOOKING_LUA)
+
+    def _key(self, *parts) -> str:
+        return ":".join(["bookings", "{" + current_tenant().hospital_id + "}", *parts])
+
+    def _load_many(self, appointment_ids) -> list:
+        appointment_ids = sorted(appointment_ids)
+        if not appointment_ids:
+            return []
+        raw = self.redis_client.mget([self._key("appt", appt_id) for appt_id in appointment_ids])
+        return [json.loads(item) for item in raw if item]
+
+    def all(self) -> list:
+        return self._load_many(self.redis_client.smembers(self._key("all")))
+
+    def find_by_phone(self, phone_number: str) -> list:
+        return self._load_many(self.redis_client.smembers(self._key("phone", phone_number)))
+
+    def find_by_id(self, appointment_id: str) -> list:
+        return self._load_many([appointment_id])
+
+    def count_bookings(self, doctor_dates: list) -> dict:
+        doctor_dates = list(dict.fromkeys(doctor_dates))
+        pipe = self.redis_client.pipeline(transaction=False)
+        for doctor_name, date in doctor_dates:
+            pipe.scard(self._key("day", doctor_name, date))
+        return dict(zip(doctor_dates, pipe.execute()))
+
+    def create(self, booking: dict, daily_limit: int = DAILY_TOKEN_LIMIT):
+        doctor_name, date = booking['doctor_name'], booking['booking_date']
+        token_number = self._create_script(
+            keys=[
+                self._key("day", doctor_name, date),
+                self._key("tokens", doctor_name, date),
+                self._key("appt", booking['appointment_id']),
+                self._key("all"),
+                self._key("phone", booking['patient_phone']),
+            ],
+            args=[daily_limit, booking['appointment_id'], json.dumps(booking)],
+        )
+        if not token_number:
+            return None
+        return dict(booking, token_number=int(token_number))
+
+    def cancel(self, appointment_id: str) -> bool:
+        found = self.find_by_id(appointment_id)
+        if not found:
+            return False # Booking ID not found
+        booking = found[0]
+        removed = self._cancel_script(
+            keys=[
+                self._key("appt", appointment_id),
+                self._key("day", booking.get('doctor_name', ''), booking.get('booking_date', '')),
+                self._key("all"),
+                self._key("phone", booking.get('patient_phone', '')),
+                self._key("tokens", booking.get('doctor_name', ''), booking.get('booking_date', '')),
+            ],
+            args=[appointment_id],
+        )
+        return bool(removed)
+
+    def import_bookings(self, bookings: list) -> int:
+        """
+        One-off migration helper: copies existing bookings (e.g. from bookings.json)
+        into Redis for the current hospital, keeping their token numbers.
+        """
+        imported = 0
+        for booking in bookings:
+            appointment_id = booking.get('appointment_id')
+            if not appointment_id or self.redis_client.exists(self._key("appt", appointment_id)):
+                continue
+            doctor_name, date = booking.get('doctor_name', ''), booking.get('booking_date', '')
+            pipe = self.redis_client.pipeline()
+            pipe.set(self._key("appt", appointment_id), json.dumps(booking))
+            pipe.sadd(self._key("all"), appointment_id)
+            pipe.sadd(self._key("phone", booking.get('patient_phone', '')), appointment_id)
+            pipe.sadd(self._key("day", doctor_name, date), appointment_id)
+            if booking.get('token_number'):
+                # Keeps imported tokens from being handed out again.
+                pipe.sadd(self._key("tokens", doctor_name, date), booking['token_number'])
+            pipe.execute()
+            imported += 1
+        return imported
+
+
+_file_store = FileBookingStore()
+_redis_store = None
+
+
+def configure_booking_store(redis_client):
+    """Switches bookings to Redis when BOOKINGS_BACKEND=redis and a client is available."""
+    global _redis_store
+    if BOOKINGS_BACKEND == "redis" and redis_client is not None:
+        _redis_store = RedisBookingStore(redis_client)
+        print("Bookings are stored in Redis.")
+    return get_booking_store()
+
+
+def get_booking_store():
+    """Returns the active booking store."""
+    return _redis_store or _file_store
@@ -0,0 +1,264 @@
+# app/my_concurrency.py
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+
+# --- Limits (override from the environment per deployment) ---
+MAX_IN_FLIGHT_RUNS = int(os.getenv("MAX_IN_FLIGHT_RUNS", "8"))
+MAX_QUEUED_RUNS = int(os.getenv("MAX_QUEUED_RUNS", "16"))
+RUN_QUEUE_TIMEOUT_SECONDS = float(os.getenv("RUN_QUEUE_TIMEOUT_SECONDS", "10"))
+SESSION_LOCK_WAIT_SECONDS = float(os.getenv("SESSION_LOCK_WAIT_SECONDS", "30"))
+SESSION_LOCK_TTL_SECONDS = int(os.getenv("SESSION_LOCK_TTL_SECONDS", "120"))
+TOOL_WORKER_THREADS = int(os.getenv("TOOL_WORKER_THREADS", "8"))
+PREFETCH_WORKER_THREADS = int(os.getenv("PREFETCH_WORKER_THREADS", "2"))
+LOOP_LAG_WARN_SECONDS = float(os.getenv("LOOP_LAG_WARN_SECONDS", "0.1"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a chat turn is shed instead of being run."""
+
+    def __init__(self, status_code: int, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.retry_after = retry_after
+
+
+class RunGovernor:
+    """
+    Caps the number of concurrent agent runs on this worker.
+    Requests beyond the cap wait in a bounded queue; once the queue is full
+    (or the wait times out) the request is rejected straight away with a 503
+    so the model quota is never oversubscribed.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._waiting = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        # Capacity is reserved before the first await, so a burst arriving in one loop tick is counted correctly.
+        if self._in_flight + self._waiting >= self.max_in_flight + self.max_queued:
+            raise AdmissionRejected(503, "The assistant is busy right now. Please try again in a moment.", retry_after=2)
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected(503, "The assistant is busy right now. Please try again in a moment.", retry_after=2)
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"in_flight": self._in_flight, "queued": self._waiting, "max_in_flight": self.max_in_flight, "max_queued": self.max_queued}
+
+
+class SessionLocks:
+    """
+    Serializes chat turns that belong to the same session.
+    A local asyncio.Lock orders turns inside this worker; when a Redis client
+    is available a short-lived Redis lock extends the guarantee across
+    replicas. Only one extra turn may wait per session - a third concurrent
+    message (e.g. repeated taps on send) is rejected with a 429.
+    """
+
+    def __init__(self, redis_client=None, wait_seconds: float = SESSION_LOCK_WAIT_SECONDS, ttl_seconds: int = SESSION_LOCK_TTL_SECONDS):
+        self.redis_client = redis_client
+        self.wait_seconds = wait_seconds
+        self.ttl_seconds = ttl_seconds
+        self._locks = {}    # session_id -> asyncio.Lock
+        self._holders = {}  # session_id -> number of turns holding or waiting
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        if self._holders.get(session_id, 0) >= 2:
+            raise AdmissionRejected(429, "A previous message in this conversation is still being processed.")
+
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._holders[session_id] = self._holders.get(session_id, 0) + 1
+        try:
+            try:
+                await asyncio.wait_for(lock.acquire(), timeout=self.wait_seconds)
+            except asyncio.TimeoutError:
+                raise AdmissionRejected(429, "A previous message in this conversation is still being processed.")
+            try:
+                token = await self._acquire_redis_lock(session_id)
+                # A slow turn (queue wait + multi-agent run) can outlive the TTL; keep renewing it while we hold it.
+                watchdog = asyncio.create_task(self._renew_redis_lock(session_id, token)) if token else None
+                try:
+                    yield
+                finally:
+                    if watchdog:
+                        watchdog.cancel()
+                    self._release_redis_lock(session_id, token)
+            finally:
+                lock.release()
+        finally:
+            self._holders[session_id] -= 1
+            if self._holders[session_id] == 0:
+                del self._holders[session_id]
+                self._locks.pop(session_id, None)
+
+    async def _acquire_redis_lock(self, session_id: str):
+        """Polls for the cross-replica lock without blocking the event loop."""
+        if not self.redis_client:
+            return None
+        token = str(uuid.uuid4())
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            try:
+                if self.redis_client.set(f"lock:{session_id}", token, nx=True, ex=self.ttl_seconds):
+                    return token
+            except Exception as e:
+                # Redis trouble should not take chat down; fall back to the local lock only.
+                print(f"[LOCK] Redis session lock unavailable, continuing with local lock: {e}")
+                return None
+            if time.monotonic() >= deadline:
+                raise AdmissionRejected(429, "A previous message in this conversation is still being processed.")
+            await asyncio.sleep(0.05)
+
+    async def _renew_redis_lock(self, session_id: str, token: str):
+        """Extends the cross-replica lock every third of its TTL for as long as we still own it."""
+        while True:
+            await asyncio.sleep(self.ttl_seconds / 3)
+            try:
+                renewed = self.redis_client.eval(
+                    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end",
+                    1, f"lock:{session_id}", token, self.ttl_seconds * 1000,
+                )
+            except Exception as e:
+                print(f"[LOCK] Failed to renew Redis session lock: {e}")
+                continue
+            if not renewed:
+                print(f"[LOCK] Redis session lock for {session_id} was lost before the turn finished.")
+                return
+
+    def _release_redis_lock(self, session_id: str, token):
+        if not self.redis_client or token is None:
+            return
+        try:
+            # Only delete the lock if we still own it (it may have expired and been re-taken).
+            self.redis_client.eval(
+                "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end",
+                1, f"lock:{session_id}", token,
+            )
+        except Exception as e:
+            print(f"[LOCK] Failed to release Redis session lock: {e}")
+
+
+# --- Blocking work off the event loop ---
+# Tool calls read/write JSON files and compute availability. Running them on a
+# bounded thread pool keeps one session's file I/O from stalling every other
+# chat on the same worker.
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKER_THREADS, thread_name_prefix="healthline-tool")
+# Speculative work gets its own small pool so it never queues ahead of real tool calls.
+_prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKER_THREADS, thread_name_prefix="healthline-prefetch")
+# Jobs are counted from submission until the worker thread is done with them
+# (not until the awaiting coroutine gives up), so the counts reflect real pool use.
+_jobs_in_flight = {_tool_executor: 0, _prefetch_executor: 0}
+_jobs_lock = threading.Lock()
+
+
+def _job_finished(executor):
+    with _jobs_lock:
+        _jobs_in_flight[executor] -= 1
+
+
+def _submit(executor, func, *args, **kwargs):
+    """Submits func to executor with the caller's context variables; returns the concurrent future."""
+    context = contextvars.copy_context()
+    with _jobs_lock:
+        _jobs_in_flight[executor] += 1
+    try:
+        future = executor.submit(context.run, func, *args, **kwargs)
+    except Exception:
+        _job_finished(executor)
+        raise
+    future.add_done_callback(lambda _: _job_finished(executor))
+    return future
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking function on the tool thread pool and awaits the result.
+    Context variables (e.g. the hospital the request is scoped to) are carried over.
+    """
+    return await asyncio.wrap_future(_submit(_tool_executor, func, *args, **kwargs))
+
+
+def submit_speculative(func, *args, **kwargs):
+    """
+    Like run_blocking, but on the small pool reserved for speculative work.
+    Returns the concurrent future so callers can tell whether the job has started.
+    """
+    return _submit(_prefetch_executor, func, *args, **kwargs)
+
+
+def speculation_allowed() -> bool:
+    """False when real tool calls already fill the tool pool or speculative work fills its own."""
+    with _jobs_lock:
+        return _jobs_in_flight[_tool_executor] < TOOL_WORKER_THREADS and _jobs_in_flight[_prefetch_executor] < PREFETCH_WORKER_THREADS
+
+
+def offload_blocking(func):
+    """
+    Decorator that turns a blocking function into an async one running on the
+    tool thread pool. The name, signature and docstring are kept, so it can sit
+    directly under @function_tool.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_blocking(func, *args, **kwargs)
+    return wrapper
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a short sleep. Lag means
+    something blocked the loop, delaying every in-flight chat on this worker.
+    """
+
+    def __init__(self, interval: float = 0.5, warn_threshold: float = LOOP_LAG_WARN_SECONDS):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+
+    async def run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.avg_lag = 0.9 * self.avg_lag + 0.1 * lag
+            if lag > self.warn_threshold:
+                print(f"[LOOP-LAG] Event loop was blocked for {lag * 1000:.0f} ms.")
+
+    def stats(self) -> dict:
+        return {
+            "loop_lag_ms": round(self.last_lag * 1000, 1),
+            "loop_lag_avg_ms": round(self.avg_lag * 1000, 1),
+            "loop_lag_max_ms": round(self.max_lag * 1000, 1),
+        }
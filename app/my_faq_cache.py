@@ -0,0 +1,117 @@
+# app/my_faq_cache.py
+
+import hashlib
+import os
+import re
+from agents.items import ToolCallItem
+from .my_functions import MIN_INFO_SCORE, _load_info_index, _score_info_sections, _tokenize_info_text, get_hospital_info_version
+from .my_tenants import current_tenant
+
+
+# --- FAQ response cache ---
+# Answers to general questions ("where is the hospital", "is there parking")
+# only depend on hospital_info.json, so a successful answer can be replayed
+# for the same question without running the agent again.
+FAQ_CACHE_TTL_SECONDS = int(os.getenv("FAQ_CACHE_TTL_SECONDS", "21600"))
+FAQ_MAX_QUESTION_TERMS = 12  # Longer messages are rarely pure FAQs; don't cache them.
+FAQ_TOOL_NAME = "get_general_hospital_info"
+# Words that only say what kind of answer is wanted. A question made of nothing
+# else ("where?", "where is it?", "number?") depends on the conversation.
+FAQ_QUESTION_WORDS = {"where", "located", "direction", "address", "location", "number", "phone", "call", "contact", "time", "timing"}
+
+
+def canonical_question(prompt: str) -> str:
+    """
+    Reduces a question to its sorted set of content words, so that
+    "Where is the hospital?" and "where is hospital" share a cache entry.
+    Returns an empty string when the prompt is not worth caching.
+    """
+    terms = set(_tokenize_info_text(prompt))
+    # "hospital" is a retrieval stopword, but it is what makes "where is the hospital" self-contained.
+    if "hospital" in re.findall(r"[a-z]+", prompt.lower()):
+        terms.add("hospital")
+    if not terms - FAQ_QUESTION_WORDS or len(terms) > FAQ_MAX_QUESTION_TERMS:
+        return ""
+    return " ".join(sorted(terms))
+
+
+def is_info_question(prompt: str) -> bool:
+    """
+    True when the question itself clearly matches a section of the info
+    document. Short context-dependent replies ("yes", "1", "ok sure") don't,
+    so they never reach the cache even if the run only used the info tool.
+    """
+    _, index = _load_info_index()
+    if not index:
+        return False
+    scores = _score_info_sections(prompt, index)
+    return bool(scores) and scores[0][0] >= MIN_INFO_SCORE
+
+
+def awaiting_reply(history: list) -> bool:
+    """
+    True when the last assistant turn asked the user something, i.e. the
+    conversation is mid-workflow and the new message answers that question.
+    """
+    for message in reversed(history[:-1]):  # history already ends with the new user message
+        if message.get("role") == "assistant":
+            return "?" in (message.get("content") or "")
+    return False
+
+
+def faq_cache_key(prompt: str):
+    """Builds the Redis key for a question; the hospital and its info file version are part of the key."""
+    canonical = canonical_question(prompt)
+    if not canonical or not is_info_question(prompt):
+        return None
+    digest = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+    return f"faq:{current_tenant().hospital_id}:{get_hospital_info_version()}:{digest}"
+
+
+def tool_names_called(result) -> list:
+    """Lists the names of all tools the master agent called during a run."""
+    return [
+        getattr(item.raw_item, "name", None)
+        for item in result.new_items
+        if isinstance(item, ToolCallItem)
+    ]
+
+
+def get_cached_answer(redis_client, prompt: str, history: list):
+    """Returns a cached FAQ answer for the prompt, or None."""
+    if awaiting_reply(history):
+        return None
+    key = faq_cache_key(prompt)
+    if not key:
+        return None
+    try:
+        return redis_client.get(key)
+    except Exception as e:
+        print(f"[FAQ-CACHE] Lookup failed: {e}")
+        return None
+
+
+def maybe_cache_answer(redis_client, prompt: str, history: list, result) -> bool:
+    """
+    Stores the run's answer if the only tool it used was the general info tool.
+    Anything that touched schedules, bookings or triage is never cached, and
+    neither is a reply given in the middle of a workflow.
+    """
+    if not result.final_output or not isinstance(result.final_output, str):
+        return False
+    if awaiting_reply(history):
+        return False
+
+    tools_used = tool_names_called(result)
+    if not tools_used or any(name != FAQ_TOOL_NAME for name in tools_used):
+        return False
+
+    key = faq_cache_key(prompt)
+    if not key:
+        return False
+    try:
+        redis_client.set(key, result.final_output, ex=FAQ_CACHE_TTL_SECONDS)
+        return True
+    except Exception as e:
+        print(f"[FAQ-CACHE] Store failed: {e}")
+        return False
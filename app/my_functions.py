@@ -1,29 +1,62 @@
 
+import hashlib
 import json
+import math
+import re
+from collections import Counter
 from typing import Optional
 import os # <--- ADD THIS LINE
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from .my_tenants import current_tenant, tenant_cache
+from .my_bookings import get_booking_store, DAILY_TOKEN_LIMIT
+from .my_schedule_snapshot import ScheduleSnapshot
 
 
 
-# --- File Paths (This part is correct) ---
-SCHEDULE_FILE = "full_hospital_schedule_with_specialty.json"
-BOOKINGS_FILE = "bookings.json"
-ABSENTS_FILE = "dr_absents.json"
+# --- File Paths ---
+# Every data file belongs to a hospital (tenant); see app/my_tenants.py.
+# The paths below are resolved per call from the tenant the request is scoped to.
+
+# All dates the assistant reasons about are in the hospital's local time,
+# regardless of where the server itself runs.
+HOSPITAL_TIMEZONE = os.getenv("HOSPITAL_TIMEZONE", "Asia/Karachi")
+
+
+def hospital_now() -> datetime:
+    """Returns the current date and time in the hospital's timezone."""
+    return datetime.now(ZoneInfo(HOSPITAL_TIMEZONE))
 
 # --- Helper Function (This part is correct) ---
 def load_schedule():
+    """
+    Loads the current hospital's schedule from its JSON file.
+    The parsed schedule is kept in the tenant cache and only re-read when the file changes.
+    """
+    schedule_file = current_tenant().schedule_file
+    try:
+        mtime = os.path.getmtime(schedule_file)
+    except OSError:
+        print(f"Error: The schedule file was not found at {schedule_file}")
+        return []
+
+    cache = tenant_cache()
+    cached = cache.get("schedule")
+    if cached and cached[0] == mtime:
+        return cached[1]
+
     print("Load Schedule tool called")
-    """Loads the full hospital schedule from the JSON file."""
     try:
-        with open(SCHEDULE_FILE, 'r') as f:
-            return json.load(f)
+        with open(schedule_file, 'r') as f:
+            schedule = json.load(f)
     except FileNotFoundError:
-        print(f"Error: The schedule file was not found at {SCHEDULE_FILE}")
+        print(f"Error: The schedule file was not found at {schedule_file}")
         return []
     except json.JSONDecodeError:
-        print(f"Error: The schedule file at {SCHEDULE_FILE} is not a valid JSON.")
+        print(f"Error: The schedule file at {schedule_file} is not a valid JSON.")
         return []
+    cache["schedule"] = (mtime, schedule)
+    return schedule
 
 # --- Helper Functions (Not tools for the agent) ---
 
@@ -63,19 +96,172 @@ import json
 from pathlib import Path
 
 # BASE_DIR = Path(__file__).resolve().parent.parent
-SCHEDULE_FILE = "full_hospital_schedule_with_specialty.json"
-BOOKINGS_FILE = "bookings.json"
-INFO_FILE = "hospital_info.json"
 
 
 def get_hospital_info() -> dict:
-    """Loads the general hospital information from its JSON file."""
+    """Loads the current hospital's general information from its JSON file."""
     try:
-        with open(INFO_FILE, 'r') as f:
+        with open(current_tenant().info_file, 'r') as f:
             return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
         return {"error": "Hospital information file not found or is invalid."}
 
+def get_hospital_profile() -> dict:
+    """Returns the current hospital's display name and appointment helpline for the agent's run context."""
+    info_data, _ = _load_info_index()
+    contact = info_data.get("contact", {})
+    return {
+        "hospital_id": current_tenant().hospital_id,
+        "hospital_name": info_data.get("hospital_name", "the hospital"),
+        "appointment_helpline": info_data.get("appointment_helpline") or contact.get("main_phone", "N/A"),
+    }
+
+# --- Hospital info retrieval (BM25 over the top-level sections of the info file) ---
+
+INFO_TOP_K = 2
+MIN_INFO_SCORE = 1.0  # Below this the question is too vague; return the whole document instead.
+
+_INFO_WORD_RE = re.compile(r"[a-z0-9]+")
+_INFO_STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "can", "do", "does", "for", "from", "have", "hospital",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "please", "tell", "the", "there",
+    "to", "what", "when", "which", "who", "with", "you", "your",
+}
+# Everyday words mapped onto the vocabulary used by the info document's section keys.
+_INFO_QUERY_SYNONYMS = {
+    "where": ["location", "address"],
+    "located": ["location", "address"],
+    "direction": ["location", "map"],
+    "phone": ["contact"],
+    "number": ["contact", "phone"],
+    "call": ["contact", "phone"],
+    "ambulance": ["emergency"],
+    "park": ["parking"],
+    "car": ["parking"],
+    "medicine": ["pharmacy"],
+    "chemist": ["pharmacy"],
+    "department": ["specialty"],
+    "specialty": ["department"],
+    "booking": ["appointment"],
+    "history": ["about"],
+}
+
+
+def _tokenize_info_text(text: str) -> list:
+    """Lowercases, splits and lightly stems text for info retrieval."""
+    tokens = []
+    for word in _INFO_WORD_RE.findall(text.lower()):
+        if word in _INFO_STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("s"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def _flatten_info_value(value) -> str:
+    if isinstance(value, dict):
+        return " ".join(f"{k.replace('_', ' ')} {_flatten_info_value(v)}" for k, v in value.items())
+    if isinstance(value, list):
+        return " ".join(_flatten_info_value(v) for v in value)
+    return str(value)
+
+
+def _build_info_index(info_data: dict) -> dict:
+    """Builds a tiny BM25 index with one document per top-level section."""
+    sections = {}
+    for key, value in info_data.items():
+        # The section key is counted twice: "parking_info" should win for "parking".
+        key_tokens = _tokenize_info_text(key.replace("_", " "))
+        sections[key] = Counter(key_tokens * 2 + _tokenize_info_text(_flatten_info_value(value)))
+
+    doc_freq = Counter()
+    for term_counts in sections.values():
+        doc_freq.update(term_counts.keys())
+    lengths = {key: sum(counts.values()) for key, counts in sections.items()}
+    avg_length = (sum(lengths.values()) / len(lengths)) if lengths else 0.0
+    return {"sections": sections, "doc_freq": doc_freq, "lengths": lengths, "avg_length": avg_length}
+
+
+def _load_info_index() -> tuple:
+    """Returns (info_data, index), rebuilding the index only when the info file changes."""
+    try:
+        mtime = os.path.getmtime(current_tenant().info_file)
+    except OSError:
+        return get_hospital_info(), None
+
+    cache = tenant_cache()
+    cached = cache.get("info_index")
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    info_data = get_hospital_info()
+    index = _build_info_index(info_data) if "error" not in info_data else None
+    cache["info_index"] = (mtime, info_data, index)
+    return info_data, index
+
+
+def get_hospital_info_version() -> str:
+    """Returns a short hash of the info file's contents; it changes whenever the file is edited."""
+    info_file = current_tenant().info_file
+    try:
+        mtime = os.path.getmtime(info_file)
+    except OSError:
+        return "missing"
+
+    cache = tenant_cache()
+    cached = cache.get("info_version")
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(info_file, 'rb') as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:12]
+    cache["info_version"] = (mtime, version)
+    return version
+
+
+def _score_info_sections(question: str, index: dict, k1: float = 1.5, b: float = 0.75) -> list:
+    """Scores each section against the question with BM25; returns [(score, key)] best first."""
+    query_terms = []
+    for token in _tokenize_info_text(question):
+        query_terms.append(token)
+        query_terms.extend(_INFO_QUERY_SYNONYMS.get(token, []))
+
+    total_sections = len(index["sections"])
+    scores = []
+    for key, term_counts in index["sections"].items():
+        length_norm = 1 - b + b * index["lengths"][key] / (index["avg_length"] or 1.0)
+        score = 0.0
+        for term in set(query_terms):
+            tf = term_counts.get(term, 0)
+            if not tf:
+                continue
+            df = index["doc_freq"][term]
+            idf = math.log(1 + (total_sections - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * length_norm)
+        scores.append((score, key))
+    scores.sort(reverse=True)
+    return scores
+
+
+def search_hospital_info(question: str, top_k: int = INFO_TOP_K) -> dict:
+    """
+    Returns only the sections of the hospital info document that best match
+    the question. Falls back to the full document when nothing scores well.
+    """
+    info_data, index = _load_info_index()
+    if not index or not question:
+        return info_data
+
+    scores = _score_info_sections(question, index)
+    best_score = scores[0][0] if scores else 0.0
+    if best_score < MIN_INFO_SCORE:
+        return info_data
+
+    # Keep runners-up only if they are reasonably close to the best match.
+    matched = {key: info_data[key] for score, key in scores[:top_k] if score >= best_score * 0.5}
+    return {"hospital_name": info_data.get("hospital_name"), "matched_sections": matched}
+
 def _internal_find_doctor(doctor_name: str, schedule: list) -> list:
     """
     Upgraded internal function for finding a doctor using word set matching.
@@ -84,7 +270,7 @@ def _internal_find_doctor(doctor_name: str, schedule: list) -> list:
         return []
     
     # Clean and split the search query into a set of words
-    search_words = set(doctor_name.lower().replace('dr.', '').replace('dr', '').replace('prof', '').strip().split())
+    search_words = _doctor_name_words(doctor_name)
     
     matching_doctors = []
     for entry in schedule:
@@ -93,7 +279,7 @@ def _internal_find_doctor(doctor_name: str, schedule: list) -> list:
             continue
         
         # Clean and split the doctor's name from the schedule into a set of words
-        schedule_name_words = set(doc_name_from_schedule.lower().replace('dr.', '').replace('dr', '').replace('prof', '').strip().split())
+        schedule_name_words = _doctor_name_words(doc_name_from_schedule)
         
         # Check if all search words are present in the doctor's name
         if search_words.issubset(schedule_name_words):
@@ -103,13 +289,86 @@ def _internal_find_doctor(doctor_name: str, schedule: list) -> list:
     unique_doctors = {doc['doctor']: doc for doc in matching_doctors}.values()
     return list(unique_doctors)
 
+def _doctor_name_words(name: str) -> set:
+    """Lowercases a doctor's name, strips titles and splits it into a set of words."""
+    return set(name.lower().replace('dr.', '').replace('dr', '').replace('prof', '').strip().split())
+
+# --- Schedule lookups (served from the compiled snapshot when one exists) ---
+
+def load_schedule_snapshot():
+    """
+    Returns the mmapped schedule snapshot for the current hospital, or None if
+    there is no snapshot (or it is older than the JSON) and the JSON should be used.
+    A snapshot replaced on disk (by rename) is picked up on the next call.
+    """
+    tenant = current_tenant()
+    try:
+        snapshot_stat = os.stat(tenant.snapshot_file)
+    except OSError:
+        return None
+
+    cache = tenant_cache()
+    # Checked on every call, so a worker that already mapped the snapshot also notices a newer JSON.
+    try:
+        if os.path.getmtime(tenant.schedule_file) > snapshot_stat.st_mtime:
+            if cache.get("stale_snapshot_warned") != snapshot_stat.st_mtime_ns:
+                print(f"Warning: {tenant.snapshot_file} is older than the schedule JSON; using the JSON until it is recompiled.")
+                cache["stale_snapshot_warned"] = snapshot_stat.st_mtime_ns
+            return None
+    except OSError:
+        pass
+
+    cached = cache.get("snapshot")
+    if cached and cached.stat.st_ino == snapshot_stat.st_ino and cached.stat.st_mtime_ns == snapshot_stat.st_mtime_ns:
+        return cached
+
+    try:
+        snapshot = ScheduleSnapshot(tenant.snapshot_file)
+    except (OSError, ValueError) as e:
+        print(f"Error: Could not map the schedule snapshot at {tenant.snapshot_file}: {e}")
+        return None
+    cache["snapshot"] = snapshot
+    return snapshot
+
+def find_schedules_by_doctor(doctor_name: str) -> list:
+    """Same results as _internal_find_doctor(doctor_name, load_schedule()), without parsing the JSON."""
+    snapshot = load_schedule_snapshot()
+    if snapshot is None:
+        return _internal_find_doctor(doctor_name, load_schedule())
+    if not doctor_name:
+        return []
+
+    search_words = _doctor_name_words(doctor_name)
+    matches = []
+    for name in snapshot.doctor_names():
+        if name and search_words.issubset(_doctor_name_words(name)):
+            rows = snapshot.rows_for_doctor(name)
+            # Mirror _internal_find_doctor: ordered by first appearance, last entry wins.
+            matches.append((rows[0], rows[-1]))
+    return snapshot.entries(row for _, row in sorted(matches))
+
+def find_schedules_by_specialty(specialty: str) -> list:
+    """Returns every schedule entry whose specialty contains the search term."""
+    search_term = specialty.lower()
+    snapshot = load_schedule_snapshot()
+    if snapshot is None:
+        return [s for s in load_schedule() if search_term in s.get('specialty', '').lower()]
+
+    rows = sorted(
+        row
+        for name in snapshot.specialties() if search_term in name.lower()
+        for row in snapshot.rows_for_specialty(name)
+    )
+    return snapshot.entries(rows)
+
 # (add this function near your other load functions)
 
 def load_absences() -> dict:
     """Loads the doctor absences from the JSON file."""
     try:
-        if os.path.exists(ABSENTS_FILE):
-            with open(ABSENTS_FILE, 'r') as f:
+        absents_file = current_tenant().absents_file
+        if os.path.exists(absents_file):
+            with open(absents_file, 'r') as f:
                 return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
         # If file is missing or invalid, assume no one is absent.
@@ -123,46 +382,26 @@ def _internal_cancel_booking(appointment_id: str) -> bool:
     Finds a booking by its unique appointment_id and removes it.
     Returns True if successful, False otherwise.
     """
-    all_bookings = load_bookings()
-    
-    # Find the booking to remove
-    booking_to_remove = None
-    for booking in all_bookings:
-        if booking.get('appointment_id') == appointment_id:
-            booking_to_remove = booking
-            break
-            
-    if not booking_to_remove:
-        return False # Booking ID not found
-
-    # Remove the booking and write the file back
-    all_bookings.remove(booking_to_remove)
-    try:
-        with open(BOOKINGS_FILE, 'w') as f:
-            json.dump(all_bookings, f, indent=4)
-        return True # Success
-    except Exception as e:
-        print(f"Error writing bookings file during cancellation: {e}")
-        return False # Failed to write file
+    store = get_booking_store()
+    found = store.find_by_id(appointment_id)
+    if not found or not store.cancel(appointment_id):
+        return False
+    booking = found[0]
+    notify_availability_change("cancel", booking.get('doctor_name'), booking.get('booking_date'), booking.get('specialty'))
+    return True
     
 def load_bookings() -> list:
-    """Loads all current bookings from the JSON file."""
-    try:
-        # We need to reference the file path defined in this file
-        with open(BOOKINGS_FILE, 'r') as f:
-            # Handle empty file case
-            content = f.read()
-            if content:
-                return json.loads(content)
-            return []
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    """Loads all current bookings from the active booking store."""
+    return get_booking_store().all()
     
 
 def get_unique_specialties() -> list:
     """Extracts a unique, sorted list of all specialties from the schedule."""
-    schedule = load_schedule()
-    all_specialties = {entry.get('specialty', 'N/A') for entry in schedule}
+    snapshot = load_schedule_snapshot()
+    if snapshot is not None:
+        all_specialties = set(snapshot.specialties())
+    else:
+        all_specialties = {entry.get('specialty', 'N/A') for entry in load_schedule()}
     # Sort and remove any 'N/A' if it exists
     sorted_specialties = sorted([s for s in all_specialties if s != 'N/A'])
     return sorted_specialties
@@ -172,10 +411,13 @@ def _calculate_availability_for_schedules(candidate_schedules: list) -> str:
     Internal helper that takes a list of schedule entries and calculates
     their real availability over the next 14 days.
     """
+    return json.dumps({"success": True, "slots": _available_slots_for_schedules(candidate_schedules)})
+
+def _available_slots_for_schedules(candidate_schedules: list) -> list:
+    """Returns the open slots (one dict per doctor per date) for the given schedule entries."""
     absences = load_absences()
-    all_bookings = load_bookings()
-    available_slots = []
-    today = datetime.now()
+    candidate_slots = []
+    today = hospital_now()
 
     for i in range(14):
         check_date = today + timedelta(days=i)
@@ -190,9 +432,96 @@ def _calculate_availability_for_schedules(candidate_schedules: list) -> str:
             if current_day_of_week in schedule_entry.get('days', []):
                 doctor_absent_dates = absences.get(doc_full_name, [])
                 if check_date_str in doctor_absent_dates: continue
-                
-                bookings_on_date = [b for b in all_bookings if b.get('doctor_name') == doc_full_name and b.get('booking_date') == check_date_str]
-                if len(bookings_on_date) < 20:
-                    available_slots.append({"doctor": doc_full_name, "specialty": schedule_entry.get('specialty'), "date": check_date_str, "day": current_day_of_week, "time": schedule_entry.get('time'), "clinic": schedule_entry.get('clinic')})
+                candidate_slots.append({"doctor": doc_full_name, "specialty": schedule_entry.get('specialty'), "date": check_date_str, "day": current_day_of_week, "time": schedule_entry.get('time'), "clinic": schedule_entry.get('clinic')})
+
+    # One round trip to the booking store for every (doctor, date) we are about to offer.
+    booking_counts = get_booking_store().count_bookings([(slot["doctor"], slot["date"]) for slot in candidate_slots])
+    available_slots = [slot for slot in candidate_slots if booking_counts.get((slot["doctor"], slot["date"]), 0) < DAILY_TOKEN_LIMIT]
+    return available_slots
+
+def _calculate_batch_availability(doctor_names: list, specialties: list) -> str:
+    """
+    Availability for several doctors and/or specialties in one pass: the
+    matching schedule entries are merged and de-duplicated, absences and
+    bookings are read once, and the slots are grouped per doctor and clinic
+    time with a compact list of open dates.
+    """
+    candidate_schedules = {}
+    not_found = []
+    for doctor_name in doctor_names:
+        matches = find_schedules_by_doctor(doctor_name)
+        if not matches:
+            not_found.append(doctor_name)
+        for entry in matches:
+            candidate_schedules[_schedule_entry_key(entry)] = entry
+    for specialty in specialties:
+        matches = find_schedules_by_specialty(specialty) if specialty.strip() else []
+        if not matches:
+            not_found.append(specialty)
+        for entry in matches:
+            candidate_schedules[_schedule_entry_key(entry)] = entry
+
+    grouped = {}
+    for slot in _available_slots_for_schedules(list(candidate_schedules.values())):
+        group = grouped.setdefault(
+            (slot["doctor"], slot["time"], slot["clinic"]),
+            {"doctor": slot["doctor"], "specialty": slot["specialty"], "time": slot["time"], "clinic": slot["clinic"], "dates": []},
+        )
+        date_label = f"{slot['date']} ({slot['day']})"
+        if date_label not in group["dates"]:
+            group["dates"].append(date_label)
+
+    return json.dumps({"success": True, "doctors": list(grouped.values()), "not_found": not_found})
+
+def _schedule_entry_key(entry: dict) -> tuple:
+    return (entry.get('doctor'), entry.get('specialty'), entry.get('time'), entry.get('clinic'), tuple(entry.get('days', [])))
+
+# --- Availability change notifications (feeds the WebSocket push channel) ---
+
+_availability_listeners = []
+_watched_mtimes = {}  # hospital_id -> {file path: mtime} for the schedule/absence watcher
+
+
+def add_availability_listener(callback):
+    """Registers callback(event) to be told whenever a doctor's capacity may have changed."""
+    _availability_listeners.append(callback)
+
+
+def notify_availability_change(reason: str, doctor_name: str = None, date: str = None, specialty: str = None):
+    """
+    Tells every listener that availability changed for the current hospital.
+    reason is "booking", "cancel" or "reload" (schedule/absences edited; doctor and date are None).
+    """
+    event = {"hospital_id": current_tenant().hospital_id, "reason": reason, "doctor": doctor_name, "specialty": specialty, "date": date}
+    for callback in _availability_listeners:
+        try:
+            callback(event)
+        except Exception as e:
+            print(f"[PUSH] Availability listener failed: {e}")
+
+
+def get_remaining_capacity(doctor_name: str, date: str) -> int:
+    """How many more bookings a doctor can take on a date."""
+    count = get_booking_store().count_bookings([(doctor_name, date)]).get((doctor_name, date), 0)
+    return max(DAILY_TOKEN_LIMIT - count, 0)
+
+
+def check_for_data_changes() -> bool:
+    """
+    Compares the current hospital's schedule, snapshot and absence files with
+    the last check and sends a "reload" notification if any of them changed.
+    """
+    tenant = current_tenant()
+    mtimes = {}
+    for path in (tenant.schedule_file, tenant.snapshot_file, tenant.absents_file):
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            mtimes[path] = None
 
-    return json.dumps({"success": True, "slots": available_slots})
\ No newline at end of file
+    previous = _watched_mtimes.get(tenant.hospital_id)
+    _watched_mtimes[tenant.hospital_id] = mtimes
+    if previous is not None and previous != mtimes:
+        notify_availability_change("reload")
+        return True
+    return False
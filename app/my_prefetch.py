@@ -0,0 +1,185 @@
+# app/my_prefetch.py
+
+import asyncio
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from .my_concurrency import run_blocking, speculation_allowed, submit_speculative
+from .my_functions import (_calculate_availability_for_schedules, _doctor_name_words, _schedule_entry_key, add_availability_listener,
+                           find_schedules_by_doctor, find_schedules_by_specialty, get_unique_specialties, load_schedule, load_schedule_snapshot)
+from .my_tenants import tenant_cache
+
+
+# --- Speculative slot prefetch ---
+# When a prompt clearly names a doctor or a specialty, the availability for it
+# is computed while the model is still thinking about its first turn. If the
+# model then calls find_slots_by_doctor_name / find_slots_by_specialty for the
+# same schedules, the tool returns the prefetched result instead of computing it.
+MAX_PREFETCH_TARGETS = 3
+_PROMPT_WORD_RE = re.compile(r"[a-z]+")
+_SPECIALTY_STEM_LENGTH = 6
+
+_active_prefetch = ContextVar("active_prefetch", default=None)
+
+
+def _availability_key(candidate_schedules: list) -> tuple:
+    return tuple(sorted(_schedule_entry_key(entry) for entry in candidate_schedules))
+
+
+def _prefetch_vocabulary() -> dict:
+    """
+    Doctor-name words and specialty stems for the current hospital, rebuilt
+    whenever its schedule (or snapshot) is reloaded.
+    """
+    snapshot = load_schedule_snapshot()
+    source = snapshot if snapshot is not None else load_schedule()
+    cache = tenant_cache()
+    cached = cache.get("prefetch_vocabulary")
+    if cached and cached[0] is source:
+        return cached[1]
+
+    doctor_names = snapshot.doctor_names() if snapshot is not None else sorted({e.get('doctor', '') for e in source})
+    doctor_words = {name: _doctor_name_words(name) for name in doctor_names if name}
+    word_counts = {}
+    for words in doctor_words.values():
+        for word in words:
+            word_counts[word] = word_counts.get(word, 0) + 1
+
+    specialty_stems = {}
+    for specialty in get_unique_specialties():
+        stems = {word[:_SPECIALTY_STEM_LENGTH] for word in _PROMPT_WORD_RE.findall(specialty.lower()) if len(word) >= 5}
+        if stems:
+            specialty_stems[specialty] = stems
+    # Words like "specialists" or "surgeons" appear in many specialties and say nothing on their own.
+    stem_counts = {}
+    for stems in specialty_stems.values():
+        for stem in stems:
+            stem_counts[stem] = stem_counts.get(stem, 0) + 1
+    specialty_stems = {name: {s for s in stems if stem_counts[s] < 3} for name, stems in specialty_stems.items()}
+
+    vocabulary = {
+        "doctor_words": doctor_words,
+        "distinctive_words": {word for word, count in word_counts.items() if count == 1 and len(word) >= 4},
+        "specialty_stems": specialty_stems,
+    }
+    cache["prefetch_vocabulary"] = (source, vocabulary)
+    return vocabulary
+
+
+def plan_prefetch_targets(prompt: str) -> list:
+    """
+    Lightweight entity detection on the user's prompt. Returns a list of
+    candidate schedule lists - one per doctor or specialty the prompt names -
+    in the same form the slot tools would look them up.
+    """
+    vocabulary = _prefetch_vocabulary()
+    prompt_words = set(_PROMPT_WORD_RE.findall(prompt.lower()))
+    prompt_stems = {word[:_SPECIALTY_STEM_LENGTH] for word in prompt_words if len(word) >= 5}
+
+    targets = []
+    for name, words in vocabulary["doctor_words"].items():
+        named = words & prompt_words
+        if len(named) >= 2 or named & vocabulary["distinctive_words"]:
+            targets.append(find_schedules_by_doctor(name))
+    for specialty, stems in vocabulary["specialty_stems"].items():
+        if stems & prompt_stems:
+            targets.append(find_schedules_by_specialty(specialty))
+    return [candidates for candidates in targets if candidates][:MAX_PREFETCH_TARGETS]
+
+
+class SlotPrefetch:
+    """Availability computations started speculatively for one chat turn."""
+
+    def __init__(self, prompt: str):
+        self._targets = {}  # availability key -> concurrent future returning the tool's JSON
+        self.stale = False
+        self.used = 0
+        self._planning = None
+        self._planned = False    # set once every target job has been submitted
+        self._discarded = False
+        self._lock = threading.Lock()  # _start_targets runs on a prefetch worker thread
+        # Under load speculation would only compete with real work, so it is skipped.
+        if speculation_allowed():
+            self._planning = submit_speculative(plan_prefetch_targets, prompt)
+            self._planning.add_done_callback(self._start_targets)
+
+    def _start_targets(self, planning):
+        # Runs on the prefetch worker that finished planning; submission counts each job straight away.
+        if planning.cancelled() or planning.exception():
+            return
+        with self._lock:
+            if self._discarded:
+                return
+            for candidates in planning.result():
+                key = _availability_key(candidates)
+                if key not in self._targets and speculation_allowed():
+                    self._targets[key] = submit_speculative(_calculate_availability_for_schedules, candidates)
+            self._planned = True
+
+    async def take(self, candidate_schedules: list):
+        """Returns the prefetched availability for exactly these schedules (once), or None."""
+        # Never wait on speculation that hasn't started: the caller computes directly instead.
+        with self._lock:
+            if not self._planned:
+                return None
+            job = self._targets.pop(_availability_key(candidate_schedules), None)
+        if job is None:
+            return None
+        if not (job.running() or job.done()):
+            job.cancel()
+            return None
+        try:
+            result = await asyncio.wrap_future(job)
+        except Exception as e:
+            print(f"[PREFETCH] Prefetched computation failed: {e}")
+            return None
+        # A booking or cancellation during this run makes the speculative result out of date.
+        if self.stale:
+            return None
+        self.used += 1
+        return result
+
+    def discard(self):
+        """Drops whatever was not used. Jobs not yet started are cancelled; running ones finish unobserved."""
+        with self._lock:
+            self._discarded = True
+            if self._planning:
+                self._planning.cancel()
+            for job in self._targets.values():
+                job.cancel()
+            self._targets.clear()
+
+
+@contextmanager
+def speculative_prefetch(prompt: str):
+    """Starts prefetching for a prompt; the slot tools consume it for the rest of the block."""
+    prefetch = SlotPrefetch(prompt)
+    token = _active_prefetch.set(prefetch)
+    try:
+        yield prefetch
+    finally:
+        _active_prefetch.reset(token)
+        prefetch.discard()
+        if prefetch.used:
+            print(f"[PREFETCH] Served {prefetch.used} slot search(es) from the speculative prefetch.")
+
+
+async def availability_for_schedules(candidate_schedules: list) -> str:
+    """Availability JSON for the given schedules, from the prefetch when it matches, otherwise computed now."""
+    prefetch = _active_prefetch.get()
+    if prefetch is not None:
+        result = await prefetch.take(candidate_schedules)
+        if result is not None:
+            return result
+    return await run_blocking(_calculate_availability_for_schedules, candidate_schedules)
+
+
+def _mark_prefetch_stale(event: dict):
+    # Called inside the tool's own context, so this is the prefetch of the run that booked/cancelled.
+    prefetch = _active_prefetch.get()
+    if prefetch is not None and event["reason"] != "reload":
+        prefetch.stale = True
+
+
+add_availability_listener(_mark_prefetch_stale)
@@ -0,0 +1,91 @@
+# app/my_push.py
+
+import json
+from .my_concurrency import run_blocking
+from .my_functions import (_calculate_batch_availability, find_schedules_by_doctor, get_remaining_capacity)
+from .my_tenants import get_tenant, use_tenant
+
+
+# --- Availability push channel ---
+# Clients subscribe to doctors and/or specialties over a WebSocket. Instead of
+# polling, they get one full snapshot when they subscribe and afterwards only
+# the capacity deltas caused by bookings, cancellations or data reloads.
+AVAILABILITY_CHANNEL = "availability-updates"  # Redis pub/sub channel shared by all replicas
+
+
+class AvailabilityHub:
+    """Keeps this worker's WebSocket subscribers and fans availability events out to them."""
+
+    def __init__(self):
+        self._subscriptions = {}  # websocket -> {"hospital_id", "doctors", "doctor_names", "specialties"}
+
+    async def subscribe(self, websocket, hospital_id: str, doctors: list, specialties: list):
+        """Registers (or replaces) a subscription and sends its initial snapshot."""
+        tenant = get_tenant(hospital_id)
+
+        def resolve():
+            with use_tenant(tenant):
+                full_names = sorted({entry['doctor'] for name in doctors for entry in find_schedules_by_doctor(name)})
+                return full_names, _calculate_batch_availability(doctors, specialties)
+
+        full_names, snapshot = await run_blocking(resolve)
+        self._subscriptions[websocket] = {
+            "hospital_id": tenant.hospital_id,
+            "doctors": doctors,
+            # Bookings carry the schedule's own doctor name, so events match on the exact name.
+            "doctor_names": set(full_names),
+            "specialties": [s.lower() for s in specialties if s.strip()],
+        }
+        await websocket.send_json({"type": "snapshot", "reason": "subscribe", **json.loads(snapshot)})
+
+    def unsubscribe(self, websocket):
+        self._subscriptions.pop(websocket, None)
+
+    def _wants(self, subscription: dict, event: dict) -> bool:
+        if subscription["hospital_id"] != event["hospital_id"]:
+            return False
+        if event["reason"] == "reload":
+            return True
+        specialty = (event.get("specialty") or "").lower()
+        if specialty and any(term in specialty for term in subscription["specialties"]):
+            return True
+        return event.get("doctor") in subscription["doctor_names"]
+
+    async def dispatch(self, event: dict):
+        """Pushes one availability event to every interested subscriber on this worker."""
+        interested = [(ws, sub) for ws, sub in list(self._subscriptions.items()) if self._wants(sub, event)]
+        if not interested:
+            return
+
+        tenant = get_tenant(event["hospital_id"])
+        if event["reason"] == "reload":
+            # Schedules or absences changed: each subscriber gets a fresh snapshot of what it follows.
+            for websocket, subscription in interested:
+                def recompute(sub=subscription):
+                    with use_tenant(tenant):
+                        return _calculate_batch_availability(sub["doctors"], sub["specialties"])
+                snapshot = await run_blocking(recompute)
+                await self._send(websocket, {"type": "snapshot", "reason": "reload", **json.loads(snapshot)})
+            return
+
+        # A booking or cancellation: compute the new capacity once, send it to everyone interested.
+        def remaining():
+            with use_tenant(tenant):
+                return get_remaining_capacity(event["doctor"], event["date"])
+        message = {
+            "type": "capacity",
+            "reason": event["reason"],
+            "doctor": event["doctor"],
+            "specialty": event.get("specialty"),
+            "date": event["date"],
+            "remaining": await run_blocking(remaining),
+        }
+        for websocket, _ in interested:
+            await self._send(websocket, message)
+
+    async def _send(self, websocket, message: dict):
+        try:
+            await websocket.send_json(message)
+        except Exception as e:
+            print(f"[PUSH] Dropping subscriber after failed send: {e}")
+            self.unsubscribe(websocket)
@@ -0,0 +1,218 @@
+# app/my_schedule_snapshot.py
+
+import json
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+
+
+# --- Binary schedule snapshot ---
+# `python -m app.my_schedule_snapshot` compiles each hospital's schedule JSON
+# into a compact, read-only file that every worker process mmaps. The OS
+# page cache then holds ONE copy of the schedule for all workers, and nothing
+# has to be parsed at startup.
+#
+# Layout (all integers little-endian uint32, every section 4-byte aligned):
+#   header      magic "HLSCHED1" + n_strings, blob_len, n_entries,
+#               n_doctors, n_specialties, n_day_rows, format_version
+#   strings     offsets[n_strings + 1], then the UTF-8 blob (interned, sorted)
+#   columns     doctor, specialty, credentials, time, clinic (string ids),
+#               days (bitmask, Monday = bit 0), each [n_entries]
+#   doctors     doctor string ids[n_doctors], row offsets[n_doctors + 1], rows[n_entries]
+#   specialties specialty string ids[n_specialties], row offsets[n_specialties + 1], rows[n_entries]
+#   weekdays    row offsets[8], rows[n_day_rows]
+SNAPSHOT_MAGIC = b"HLSCHED1"
+SNAPSHOT_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8s7I")
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+_STRING_COLUMNS = ["doctor", "specialty", "credentials", "time", "clinic"]
+
+
+def _u32_array(values) -> bytes:
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+def _csr_index(keys: list, rows_by_key: dict) -> tuple:
+    """Builds (offsets, rows) so rows_by_key[keys[i]] == rows[offsets[i]:offsets[i + 1]]."""
+    offsets, rows = [0], []
+    for key in keys:
+        rows.extend(rows_by_key[key])
+        offsets.append(len(rows))
+    return offsets, rows
+
+
+def compile_schedule(schedule: list) -> bytes:
+    """Turns a parsed schedule (list of entry dicts) into snapshot bytes."""
+    strings = sorted({str(entry.get(column, "N/A")) for entry in schedule for column in _STRING_COLUMNS})
+    string_ids = {value: i for i, value in enumerate(strings)}
+    encoded = [value.encode("utf-8") for value in strings]
+    string_offsets = [0]
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+    blob = b"".join(encoded)
+    blob += b"\0" * (-len(blob) % 4)
+
+    columns = {column: [string_ids[str(entry.get(column, "N/A"))] for entry in schedule] for column in _STRING_COLUMNS}
+    days_masks = []
+    for entry in schedule:
+        mask = 0
+        for day in entry.get("days", []):
+            if day in WEEKDAYS:
+                mask |= 1 << WEEKDAYS.index(day)
+        days_masks.append(mask)
+
+    # Doctor and specialty indexes: string ids sorted, each pointing at its rows.
+    doctor_rows, specialty_rows = {}, {}
+    for row in range(len(schedule)):
+        doctor_rows.setdefault(columns["doctor"][row], []).append(row)
+        specialty_rows.setdefault(columns["specialty"][row], []).append(row)
+    doctor_ids, specialty_ids = sorted(doctor_rows), sorted(specialty_rows)
+    doctor_offsets, doctor_index_rows = _csr_index(doctor_ids, doctor_rows)
+    specialty_offsets, specialty_index_rows = _csr_index(specialty_ids, specialty_rows)
+
+    weekday_rows = {day: [row for row, mask in enumerate(days_masks) if mask & (1 << day)] for day in range(7)}
+    weekday_offsets, weekday_index_rows = _csr_index(range(7), weekday_rows)
+
+    parts = [
+        _HEADER.pack(SNAPSHOT_MAGIC, len(strings), len(blob), len(schedule), len(doctor_ids),
+                     len(specialty_ids), len(weekday_index_rows), SNAPSHOT_FORMAT_VERSION),
+        _u32_array(string_offsets),
+        blob,
+    ]
+    parts.extend(_u32_array(columns[column]) for column in _STRING_COLUMNS)
+    parts.append(_u32_array(days_masks))
+    parts.extend([_u32_array(doctor_ids), _u32_array(doctor_offsets), _u32_array(doctor_index_rows)])
+    parts.extend([_u32_array(specialty_ids), _u32_array(specialty_offsets), _u32_array(specialty_index_rows)])
+    parts.extend([_u32_array(weekday_offsets), _u32_array(weekday_index_rows)])
+    return b"".join(parts)
+
+
+def write_snapshot(schedule_file: str, snapshot_file: str) -> int:
+    """
+    Compiles schedule_file into snapshot_file. The new file is written next to
+    the old one and swapped in with a rename, so readers never see a partial file.
+    Returns the number of schedule entries written.
+    """
+    with open(schedule_file, "r") as f:
+        schedule = json.load(f)
+    data = compile_schedule(schedule)
+    tmp_file = f"{snapshot_file}.tmp.{os.getpid()}"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, snapshot_file)
+    return len(schedule)
+
+
+class ScheduleSnapshot:
+    """
+    Read-only view over a compiled snapshot file. Columns and indexes are
+    memoryviews straight into the mapped file; only strings that are actually
+    returned get decoded.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise ValueError("Schedule snapshots can only be mapped on little-endian machines.")
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+
+        magic, n_strings, blob_len, n_entries, n_doctors, n_specialties, n_day_rows, version = _HEADER.unpack_from(view, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a supported schedule snapshot.")
+        self.n_entries = n_entries
+        self._decoded = {}
+
+        position = _HEADER.size
+
+        def take_u32(count: int):
+            nonlocal position
+            section = view[position:position + count * 4].cast("I")
+            position += count * 4
+            return section
+
+        self._string_offsets = take_u32(n_strings + 1)
+        self._blob = view[position:position + blob_len]
+        position += blob_len
+        self._columns = {column: take_u32(n_entries) for column in _STRING_COLUMNS}
+        self._days = take_u32(n_entries)
+        self._doctor_ids, self._doctor_offsets, self._doctor_rows = take_u32(n_doctors), take_u32(n_doctors + 1), take_u32(n_entries)
+        self._specialty_ids, self._specialty_offsets, self._specialty_rows = take_u32(n_specialties), take_u32(n_specialties + 1), take_u32(n_entries)
+        self._weekday_offsets, self._weekday_rows = take_u32(8), take_u32(n_day_rows)
+
+    def string(self, string_id: int) -> str:
+        value = self._decoded.get(string_id)
+        if value is None:
+            start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+            value = str(self._blob[start:end], "utf-8")
+            self._decoded[string_id] = value
+        return value
+
+    def entry(self, row: int) -> dict:
+        """Materializes one schedule row in the same shape as the JSON schedule."""
+        mask = self._days[row]
+        return {
+            "specialty": self.string(self._columns["specialty"][row]),
+            "doctor": self.string(self._columns["doctor"][row]),
+            "credentials": self.string(self._columns["credentials"][row]),
+            "days": [day for i, day in enumerate(WEEKDAYS) if mask & (1 << i)],
+            "time": self.string(self._columns["time"][row]),
+            "clinic": self.string(self._columns["clinic"][row]),
+        }
+
+    def entries(self, rows) -> list:
+        return [self.entry(row) for row in rows]
+
+    def doctor_names(self) -> list:
+        return [self.string(string_id) for string_id in self._doctor_ids]
+
+    def specialties(self) -> list:
+        return [self.string(string_id) for string_id in self._specialty_ids]
+
+    def rows_for_doctor(self, doctor_name: str) -> list:
+        return self._lookup(doctor_name, self._doctor_ids, self._doctor_offsets, self._doctor_rows)
+
+    def rows_for_specialty(self, specialty: str) -> list:
+        return self._lookup(specialty, self._specialty_ids, self._specialty_offsets, self._specialty_rows)
+
+    def rows_for_weekday(self, weekday: str) -> list:
+        day = WEEKDAYS.index(weekday)
+        return list(self._weekday_rows[self._weekday_offsets[day]:self._weekday_offsets[day + 1]])
+
+    def _lookup(self, value: str, ids, offsets, rows) -> list:
+        # Strings are interned in sorted order, so string ids sort like the strings themselves.
+        string_id = self._string_id(value)
+        if string_id is None:
+            return []
+        i = bisect_left(ids, string_id)
+        if i == len(ids) or ids[i] != string_id:
+            return []
+        return list(rows[offsets[i]:offsets[i + 1]])
+
+    def _string_id(self, value: str):
+        low, high = 0, len(self._string_offsets) - 1
+        while low < high:
+            mid = (low + high) // 2
+            if self.string(mid) < value:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(self._string_offsets) - 1 and self.string(low) == value:
+            return low
+        return None
+
+
+if __name__ == "__main__":
+    # Compile step: python -m app.my_schedule_snapshot [hospital_id ...]
+    from .my_tenants import discover_tenants
+
+    tenants = discover_tenants()
+    for hospital_id in sys.argv[1:] or sorted(tenants):
+        tenant = tenants[hospital_id]
+        count = write_snapshot(tenant.schedule_file, tenant.snapshot_file)
+        print(f"Compiled {count} schedule entries for '{hospital_id}' into {tenant.snapshot_file}")
@@ -0,0 +1,137 @@
+# app/my_tenants.py
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+
+# --- File names inside every hospital's data directory ---
+SCHEDULE_FILENAME = "full_hospital_schedule_with_specialty.json"
+BOOKINGS_FILENAME = "bookings.json"
+ABSENTS_FILENAME = "dr_absents.json"
+INFO_FILENAME = "hospital_info.json"
+SNAPSHOT_FILENAME = "schedule.snapshot"  # Compiled by `python -m app.my_schedule_snapshot`
+
+# The original single hospital keeps living in the project root as "default";
+# every other branch gets its own folder: tenants/<hospital_id>/*.json
+DEFAULT_HOSPITAL_ID = os.getenv("DEFAULT_HOSPITAL_ID", "default")
+DEFAULT_TENANT_DIR = os.getenv("DEFAULT_TENANT_DIR", ".")
+TENANTS_DIR = os.getenv("TENANTS_DIR", "tenants")
+
+# How many hospitals keep their parsed schedules/indexes in memory at once.
+MAX_WARM_TENANTS = int(os.getenv("MAX_WARM_TENANTS", "8"))
+
+
+class UnknownTenant(Exception):
+    """Raised when a request names a hospital_id that has no data directory."""
+
+
+@dataclass(frozen=True)
+class HospitalTenant:
+    hospital_id: str
+    data_dir: str
+
+    @property
+    def schedule_file(self) -> str:
+        return os.path.join(self.data_dir, SCHEDULE_FILENAME)
+
+    @property
+    def bookings_file(self) -> str:
+        return os.path.join(self.data_dir, BOOKINGS_FILENAME)
+
+    @property
+    def absents_file(self) -> str:
+        return os.path.join(self.data_dir, ABSENTS_FILENAME)
+
+    @property
+    def info_file(self) -> str:
+        return os.path.join(self.data_dir, INFO_FILENAME)
+
+    @property
+    def snapshot_file(self) -> str:
+        return os.path.join(self.data_dir, SNAPSHOT_FILENAME)
+
+
+_tenants = {}                 # hospital_id -> HospitalTenant
+_tenant_caches = OrderedDict()  # hospital_id -> dict of cached data, least recently used first
+_current_tenant = ContextVar("current_tenant", default=None)
+_tenant_caches_lock = threading.Lock()  # Tools touch the caches from the tool thread pool
+
+
+def register_tenant(hospital_id: str, data_dir: str) -> HospitalTenant:
+    """Adds (or replaces) a hospital and drops anything cached for it."""
+    tenant = HospitalTenant(hospital_id=hospital_id, data_dir=data_dir)
+    _tenants[hospital_id] = tenant
+    _tenant_caches.pop(hospital_id, None)
+    return tenant
+
+
+def discover_tenants() -> dict:
+    """Registers the default hospital plus every folder under TENANTS_DIR that has a schedule."""
+    if DEFAULT_HOSPITAL_ID not in _tenants:
+        register_tenant(DEFAULT_HOSPITAL_ID, DEFAULT_TENANT_DIR)
+
+    if os.path.isdir(TENANTS_DIR):
+        for name in sorted(os.listdir(TENANTS_DIR)):
+            data_dir = os.path.join(TENANTS_DIR, name)
+            if name not in _tenants and os.path.isfile(os.path.join(data_dir, SCHEDULE_FILENAME)):
+                register_tenant(name, data_dir)
+    return dict(_tenants)
+
+
+def get_tenant(hospital_id: str = None) -> HospitalTenant:
+    """
+    Looks up a hospital by id. Only registered/discovered ids are accepted,
+    so a hospital_id from a request can never point at an arbitrary path.
+    """
+    hospital_id = hospital_id or DEFAULT_HOSPITAL_ID
+    if hospital_id not in _tenants:
+        discover_tenants()
+    if hospital_id not in _tenants:
+        raise UnknownTenant(f"Unknown hospital_id: {hospital_id}")
+    return _tenants[hospital_id]
+
+
+def current_tenant() -> HospitalTenant:
+    """Returns the hospital the current request/tool call is scoped to."""
+    return _current_tenant.get() or get_tenant(DEFAULT_HOSPITAL_ID)
+
+
+@contextmanager
+def use_tenant(tenant: HospitalTenant):
+    """Scopes everything inside the block (including agent tool calls) to one hospital."""
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+def tenant_cache(tenant: HospitalTenant = None) -> dict:
+    """
+    Returns the in-memory cache dict for a hospital (parsed schedule, indexes...).
+    Only MAX_WARM_TENANTS hospitals are kept; the least recently used one is
+    evicted and simply rebuilt from its files the next time it is needed.
+    """
+    tenant = tenant or current_tenant()
+    with _tenant_caches_lock:
+        cache = _tenant_caches.get(tenant.hospital_id)
+        if cache is None:
+            cache = {}
+            _tenant_caches[tenant.hospital_id] = cache
+            while len(_tenant_caches) > MAX_WARM_TENANTS:
+                evicted_id, _ = _tenant_caches.popitem(last=False)
+                print(f"[TENANTS] Evicted cached data for cold hospital '{evicted_id}'.")
+        else:
+            _tenant_caches.move_to_end(tenant.hospital_id)
+    return cache
+
+
+def session_key(hospital_id: str, session_id: str) -> str:
+    """Namespaces chat sessions per hospital (default-hospital keys are unchanged)."""
+    if hospital_id == DEFAULT_HOSPITAL_ID:
+        return session_id
+    return f"{hospital_id}:{session_id}"
@@ -4,16 +4,21 @@ import json
 from agents import function_tool
 from datetime import datetime, timedelta
 import uuid
-from .my_functions import (_calculate_availability_for_schedules, get_hospital_info, load_bookings, load_schedule, load_absences, _internal_find_doctor, send_sms, _internal_cancel_booking,get_unique_specialties)
+from .my_functions import (_calculate_batch_availability, _doctor_name_words, search_hospital_info, load_absences, notify_availability_change, find_schedules_by_doctor, find_schedules_by_specialty, send_sms, _internal_cancel_booking,get_unique_specialties)
+from .my_bookings import get_booking_store, DAILY_TOKEN_LIMIT
+from .my_concurrency import offload_blocking, run_blocking
+from .my_prefetch import availability_for_schedules
 
 
-# --- File Paths ---
-SCHEDULE_FILE = "full_hospital_schedule_with_specialty.json"
-BOOKINGS_FILE = "bookings.json"
-ABSENTS_FILE = "dr_absents.json"
+# --- Data Access ---
+# Data files are per hospital; tools always act on the tenant the current request is scoped to.
+# Bookings go through the active booking store (bookings.json or Redis, see app/my_bookings.py).
+# Every tool is async: @offload_blocking runs its file I/O and availability work on the
+# tool thread pool so the event loop stays free for other chats.
 
 
 @function_tool
+@offload_blocking
 def list_available_specialties() -> str:
     """
     Returns a JSON list of all medical specialties available at the hospital.
@@ -88,13 +93,13 @@ def list_available_specialties() -> str:
     
 
 @function_tool
+@offload_blocking
 def find_doctor_by_name(doctor_name: str) -> str:
     """
     Finds doctors by name and returns a simplified list of their names and specialties.
     """
     print("Find Doctor tool called")
-    schedule = load_schedule()
-    matching_doctors = _internal_find_doctor(doctor_name, schedule)
+    matching_doctors = find_schedules_by_doctor(doctor_name)
 
     # --- THIS IS THE KEY CHANGE ---
     # Instead of returning everything, create a clean, simple list.
@@ -109,21 +114,18 @@ def find_doctor_by_name(doctor_name: str) -> str:
     return json.dumps(simplified_results)
 
 @function_tool
+@offload_blocking
 def list_doctors_by_specialty(specialty: str) -> str:
     """
     Finds all doctors within a given specialty.
     Returns the result as a JSON string.
     """
-    schedule = load_schedule()
-    search_term = specialty.lower()
-    matching_specialists = [
-        entry for entry in schedule
-        if search_term in entry['specialty'].lower()
-    ]
+    matching_specialists = find_schedules_by_specialty(specialty)
     return json.dumps(matching_specialists)
 
 
 @function_tool
+@offload_blocking
 def book_appointment(doctor_name: str, booking_date: str, booking_time: str, patient_name: str, patient_phone: str) -> str:
     """
     Finalizes and saves a patient's appointment. This is the final, robust version.
@@ -131,40 +133,36 @@ def book_appointment(doctor_name: str, booking_date: str, booking_time: str, pat
     print(f"\n[TOOL-DEBUG] --- Starting Final Booking ---")
     print(f"[TOOL-DEBUG] Received: Dr={doctor_name}, Date={booking_date}, Time={booking_time}, Patient={patient_name}, Phone={patient_phone}")
 
-    # 1. Load existing bookings
-    try:
-        with open(BOOKINGS_FILE, 'r') as f:
-            all_bookings = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        all_bookings = []
-
-    # 2. Calculate the next token number using .get() for safety
-    bookings_today = [
-        b for b in all_bookings 
-        if b.get('doctor_name') == doctor_name and b.get('booking_date') == booking_date
-    ]
-    token_number = len(bookings_today) + 1
-
-    if token_number > 20:
-        return json.dumps({"success": False, "message": "Sorry, the clinic is fully booked for this doctor on this day."})
-    
-    # 3. Find doctor's details from the main schedule
-    schedule = load_schedule()
-    doctor_info_list = _internal_find_doctor(doctor_name, schedule)
+    # 1. Find doctor's details from the main schedule
+    doctor_info_list = find_schedules_by_doctor(doctor_name)
     
     if not doctor_info_list:
          return json.dumps({"success": False, "message": "Critical error: Could not find the doctor's base schedule information."})
 
+    if len(doctor_info_list) > 1:
+        # Several doctors share these name words; only an exact name match is unambiguous.
+        exact_matches = [e for e in doctor_info_list if _doctor_name_words(e.get('doctor', '')) == _doctor_name_words(doctor_name)]
+        if len(exact_matches) != 1:
+            return json.dumps({
+                "success": False,
+                "message": "This name matches more than one doctor. Please confirm which doctor the patient wants.",
+                "matching_doctors": [e.get('doctor') for e in doctor_info_list],
+            })
+        doctor_info_list = exact_matches
+
     # --- THIS IS THE KEY RESILIENCY FIX ---
-    # We safely get the first schedule entry and use .get() for resilience against bad data.
+    # We safely get the schedule entry and use .get() for resilience against bad data.
     doctor_schedule_entry = doctor_info_list[0]
+    # Bookings are stored under the schedule's own spelling, so capacity and tokens
+    # are counted per doctor no matter how the name was typed.
+    doctor_name = doctor_schedule_entry['doctor']
     specialty = doctor_schedule_entry.get('specialty', 'N/A')
     clinic = doctor_schedule_entry.get('clinic', 'N/A')
 
-    # 4. Generate the new booking record
+    # 2. Generate the new booking record (the store assigns the token number)
     new_booking = {
         "appointment_id": str(uuid.uuid4()),
-        "token_number": token_number,
+        "token_number": None,
         "patient_name": patient_name,
         "patient_phone": patient_phone,
         "doctor_name": doctor_name,
@@ -174,15 +172,19 @@ def book_appointment(doctor_name: str, booking_date: str, booking_time: str, pat
         "clinic": clinic
     }
 
+    # 3. Check capacity, allocate the token and save - as one step in the booking store
     print(f"[TOOL-DEBUG] Attempting to save booking: {new_booking}")
     try:
-        all_bookings.append(new_booking)
-        with open(BOOKINGS_FILE, 'w') as f:
-            json.dump(all_bookings, f, indent=4)
+        saved_booking = get_booking_store().create(new_booking, DAILY_TOKEN_LIMIT)
     except Exception as e:
         print(f"[TOOL-DEBUG] ERROR saving booking: {e}")
         return json.dumps({"success": False, "message": f"A system error occurred while saving the booking. Details: {str(e)}"})
 
+    if saved_booking is None:
+        return json.dumps({"success": False, "message": "Sorry, the clinic is fully booked for this doctor on this day."})
+
+    new_booking = saved_booking
+    token_number = new_booking['token_number']
     print(f"[TOOL-DEBUG] Booking saved successfully.")
 
     # 5. Simulate SMS Confirmation
@@ -193,6 +195,7 @@ def book_appointment(doctor_name: str, booking_date: str, booking_time: str, pat
         f"Please arrive at clinic {clinic}."
     )
     send_sms(patient_phone, confirmation_message)
+    notify_availability_change("booking", doctor_name, booking_date, specialty)
 
     return json.dumps({
         "success": True, 
@@ -202,27 +205,28 @@ def book_appointment(doctor_name: str, booking_date: str, booking_time: str, pat
 
 
 @function_tool
+@offload_blocking
 def find_booking_by_phone(phone_number: str) -> str:
     """
     Finds existing bookings using ONLY the patient's phone number.
     """
     print(f"[TOOL-DEBUG] Finding bookings for phone: {phone_number}")
-    all_bookings = load_bookings()
-    found_bookings = [b for b in all_bookings if b.get('patient_phone') == phone_number]
+    found_bookings = get_booking_store().find_by_phone(phone_number)
     return json.dumps({"success": True, "bookings": found_bookings})
 
 @function_tool
+@offload_blocking
 def find_booking_by_id(appointment_id: str) -> str:
     """
     Finds an existing booking using ONLY the unique appointment ID.
     """
     print(f"[TOOL-DEBUG] Finding booking for ID: {appointment_id}")
-    all_bookings = load_bookings()
-    found_bookings = [b for b in all_bookings if b.get('appointment_id') == appointment_id]
+    found_bookings = get_booking_store().find_by_id(appointment_id)
     return json.dumps({"success": True, "bookings": found_bookings})
 
 
 @function_tool
+@offload_blocking
 def cancel_appointment(appointment_id: str) -> str:
     """
     Cancels an appointment using its unique appointment_id.
@@ -237,6 +241,7 @@ def cancel_appointment(appointment_id: str) -> str:
         return json.dumps({"success": False, "message": f"Failed to cancel appointment {appointment_id}. The ID may not exist."})
 
 @function_tool
+@offload_blocking
 def get_general_hospital_info(question: str) -> str:
     """
     Used to answer general questions about the hospital, such as location,
@@ -244,37 +249,46 @@ def get_general_hospital_info(question: str) -> str:
     The 'question' parameter should be the user's original query.
     """
     print(f"[TOOL-DEBUG] Getting general info for question: {question}")
-    
-    # This tool's job is simple: retrieve ALL the information.
-    # The AI model will then intelligently find the answer within this data.
-    info_data = get_hospital_info()
-    
-    # Return the entire info blob as a JSON string.
+
+    # Only the sections relevant to the question are returned (the whole
+    # document is sent back if the question doesn't clearly match any section).
+    info_data = search_hospital_info(question)
     return json.dumps(info_data)
 
 @function_tool
-def find_slots_by_doctor_name(doctor_name: str) -> str:
+async def find_slots_by_doctor_name(doctor_name: str) -> str:
     """
     Use this tool to find all available appointment slots for a specific doctor by their name.
     """
     print(f"[TOOL-DEBUG] Searching slots for DOCTOR: {doctor_name}")
     # This tool's logic is a simplified version of the old one
-    candidate_schedules = _internal_find_doctor(doctor_name, load_schedule())
+    candidate_schedules = await run_blocking(find_schedules_by_doctor, doctor_name)
     if not candidate_schedules:
         return json.dumps({"success": True, "slots": []})
     
-    # We can reuse the core availability logic in a new helper function
-    return _calculate_availability_for_schedules(candidate_schedules)
+    # Served from the speculative prefetch when it already computed these schedules
+    return await availability_for_schedules(candidate_schedules)
 
 @function_tool
-def find_slots_by_specialty(specialty: str) -> str:
+async def find_slots_by_specialty(specialty: str) -> str:
     """
     Use this tool to find all available appointment slots for a specific medical specialty.
     """
     print(f"[TOOL-DEBUG] Searching slots for SPECIALTY: {specialty}")
-    schedule = load_schedule()
-    candidate_schedules = [s for s in schedule if specialty.lower() in s.get('specialty', '').lower()]
+    candidate_schedules = await run_blocking(find_schedules_by_specialty, specialty)
     if not candidate_schedules:
         return json.dumps({"success": True, "slots": []})
         
-    return _calculate_availability_for_schedules(candidate_schedules)
\ No newline at end of file
+    return await availability_for_schedules(candidate_schedules)
+
+@function_tool
+@offload_blocking
+def find_slots_for_doctors_and_specialties(doctor_names: list[str], specialties: list[str]) -> str:
+    """
+    Use this tool when the user asks about SEVERAL doctors and/or specialties in one message
+    (e.g. "is Dr. Amin or Dr. Farheen free this week, or any cardiologist?").
+    Pass every doctor name and every specialty in a single call; use an empty list for the one you don't need.
+    Returns available dates grouped per doctor, plus any names or specialties that matched nothing.
+    """
+    print(f"[TOOL-DEBUG] Batch slot search: Doctors={doctor_names}, Specialties={specialties}")
+    return _calculate_batch_availability(doctor_names, specialties)
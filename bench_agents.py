@@ -0,0 +1,324 @@
+# bench_agents.py
+#
+# Record/replay benchmark for the master agent workflow.
+#
+#   python bench_agents.py --record            # run scenarios against the real model, save fixtures
+#   python bench_agents.py                     # replay fixtures offline and compare with the baseline
+#   python bench_agents.py --update-baseline   # replay and accept the numbers as the new baseline
+#
+# Model responses are recorded once per scenario (benchmarks/fixtures/) and
+# replayed without any network calls, while the real tools run against a
+# throwaway copy of the hospital data. Each fixture stores a fingerprint of the
+# agent instructions and tool schemas; after changing a prompt or a tool the
+# replay refuses the stale fixture until it is re-recorded. The run fails if
+# model turns, tool calls, tokens or wall time regress past the thresholds below.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = "benchmarks"
+SCENARIOS_FILE = os.path.join(BENCH_DIR, "scenarios.json")
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+OUTPUT_FILE = "bench_output.txt"
+
+# --- Regression thresholds ---
+MAX_EXTRA_MODEL_TURNS = 0       # any extra model turn is a regression
+MAX_EXTRA_TOOL_CALLS = 0
+MAX_TOKEN_INCREASE = 0.10       # +10% prompt or completion tokens
+MAX_WALL_TIME_INCREASE = 0.50   # +50% replay wall time...
+MIN_WALL_TIME_SLACK_S = 0.25    # ...and at least this many seconds, to ignore noise
+
+# The booking that the "cancel" scenario refers to.
+SEED_BOOKING = {
+    "appointment_id": "bench-0001",
+    "token_number": 1,
+    "patient_name": "Bench Patient",
+    "patient_phone": "03000000000",
+    "doctor_name": "Dr. Pyar Ali",
+    "specialty": "Consultant Physicians/Specialists Internal Medicine",
+    "booking_date": "2099-01-05",
+    "booking_time": "12:00NOON TO 02:00PM",
+    "clinic": "13",
+}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Record/replay benchmark for the HealthLine master agent.")
+    parser.add_argument("--record", action="store_true", help="Call the real model and (re)write the fixtures.")
+    parser.add_argument("--update-baseline", action="store_true", help="Save this run's numbers as the new baseline.")
+    parser.add_argument("scenarios", nargs="*", help="Only run these scenarios (default: all).")
+    return parser.parse_args()
+
+
+args = _parse_args()
+if not args.record:
+    # Replays never reach the provider, so a real API key isn't needed.
+    os.environ.setdefault("GEMINI_API_KEY", "replay-only")
+
+from agents import Runner, set_tracing_disabled
+from agents.items import ModelResponse, ToolCallItem
+from agents.models.interface import Model
+from agents.usage import Usage
+from openai.types.responses.response_output_item import ResponseOutputItem
+from openai.types.responses.response_usage import InputTokensDetails, OutputTokensDetails
+from pydantic import TypeAdapter
+from dataclasses import replace
+
+from app import my_agents
+from app.my_agents import build_run_context
+from app.my_tenants import SCHEDULE_FILENAME, ABSENTS_FILENAME, INFO_FILENAME, SNAPSHOT_FILENAME, BOOKINGS_FILENAME, get_tenant, register_tenant, use_tenant
+from geminiConfig import gemini_config
+
+set_tracing_disabled(True)
+_output_item_adapter = TypeAdapter(ResponseOutputItem)
+
+
+class FixtureExhausted(Exception):
+    """The workflow asked the model for more turns than were recorded."""
+
+
+class StaleFixture(Exception):
+    """The fixture was recorded against different agent instructions or tools."""
+
+
+def workflow_fingerprint() -> str:
+    """
+    Hash of everything the recorded model responses depend on: each agent's
+    instructions and the name, description and schema of every master tool.
+    """
+    agents = [my_agents.master_agent, my_agents.symptom_analysis_agent, my_agents.specialty_matcher_agent]
+    workflow = {
+        "instructions": {agent.name: str(agent.instructions) for agent in agents},
+        "tools": [
+            {"name": tool.name, "description": tool.description, "schema": tool.params_json_schema}
+            for tool in my_agents.master_agent.tools
+        ],
+    }
+    return hashlib.sha1(json.dumps(workflow, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class ModelTape:
+    """Recorded model responses for one scenario, one list per agent."""
+
+    def __init__(self, tapes: dict = None):
+        self.tapes = tapes or {}
+        self._positions = {}
+        self.exhausted = None  # Set if a replay ran past the end of a tape
+        self.model_turns = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def _count(self, usage: dict):
+        self.model_turns += 1
+        self.prompt_tokens += usage.get("input_tokens", 0)
+        self.completion_tokens += usage.get("output_tokens", 0)
+
+    def append(self, agent_name: str, response: ModelResponse):
+        recorded = {
+            "output": [item.model_dump(mode="json") for item in response.output],
+            "usage": {
+                "input_tokens": response.usage.input_tokens,
+                "cached_tokens": getattr(getattr(response.usage, "input_tokens_details", None), "cached_tokens", 0) or 0,
+                "output_tokens": response.usage.output_tokens,
+            },
+        }
+        self.tapes.setdefault(agent_name, []).append(recorded)
+        self._count(recorded["usage"])
+
+    def next(self, agent_name: str) -> ModelResponse:
+        position = self._positions.get(agent_name, 0)
+        responses = self.tapes.get(agent_name, [])
+        if position >= len(responses):
+            # Remembered as well as raised: inside agent-as-tool calls the SDK turns exceptions into tool output.
+            self.exhausted = FixtureExhausted(f"No recorded response #{position + 1} for {agent_name}; re-record the fixture.")
+            raise self.exhausted
+        self._positions[agent_name] = position + 1
+        recorded = responses[position]
+        self._count(recorded["usage"])
+        usage = recorded["usage"]
+        return ModelResponse(
+            output=[_output_item_adapter.validate_python(item) for item in recorded["output"]],
+            usage=Usage(
+                requests=1,
+                input_tokens=usage["input_tokens"],
+                input_tokens_details=InputTokensDetails(cached_tokens=usage.get("cached_tokens", 0)),
+                output_tokens=usage["output_tokens"],
+                output_tokens_details=OutputTokensDetails(reasoning_tokens=0),
+                total_tokens=usage["input_tokens"] + usage["output_tokens"],
+            ),
+            response_id=None,
+        )
+
+
+class RecordingModel(Model):
+    """Passes calls through to the real model and records every response."""
+
+    def __init__(self, agent_name: str, inner: Model, tape: ModelTape):
+        self.agent_name, self.inner, self.tape = agent_name, inner, tape
+
+    async def get_response(self, *args, **kwargs):
+        response = await self.inner.get_response(*args, **kwargs)
+        self.tape.append(self.agent_name, response)
+        return response
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError("The benchmark does not stream.")
+
+
+class ReplayModel(Model):
+    """Answers from the recorded tape without any network calls."""
+
+    def __init__(self, agent_name: str, tape: ModelTape):
+        self.agent_name, self.tape = agent_name, tape
+
+    async def get_response(self, *args, **kwargs):
+        return self.tape.next(self.agent_name)
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError("The benchmark does not stream.")
+
+
+def _prepare_bench_tenant(data_dir: str):
+    """Copies the default hospital's data into data_dir so booking/cancel tools can't touch real files."""
+    source = get_tenant()
+    for filename in (SCHEDULE_FILENAME, ABSENTS_FILENAME, INFO_FILENAME, SNAPSHOT_FILENAME):
+        if os.path.exists(os.path.join(source.data_dir, filename)):
+            shutil.copy2(os.path.join(source.data_dir, filename), os.path.join(data_dir, filename))
+    with open(os.path.join(data_dir, BOOKINGS_FILENAME), "w") as f:
+        json.dump([SEED_BOOKING], f, indent=4)
+    return register_tenant("bench", data_dir)
+
+
+async def run_scenario(scenario: dict, record: bool) -> dict:
+    """Plays one scripted conversation and returns its metrics."""
+    fixture_file = os.path.join(FIXTURES_DIR, f"{scenario['name']}.json")
+    if record:
+        tape = ModelTape()
+    else:
+        with open(fixture_file, "r") as f:
+            fixture = json.load(f)
+        if fixture.get("fingerprint") != workflow_fingerprint():
+            raise StaleFixture("stale fixture, re-record (agent instructions or tool schemas changed since it was recorded)")
+        tape = ModelTape(fixture["tapes"])
+
+    def wrap(agent_name: str, real_model):
+        return RecordingModel(agent_name, real_model, tape) if record else ReplayModel(agent_name, tape)
+
+    # Sub-agents carry their own model; the master agent uses the run config's.
+    sub_agents = [my_agents.symptom_analysis_agent, my_agents.specialty_matcher_agent]
+    original_models = [agent.model for agent in sub_agents]
+    for agent in sub_agents:
+        agent.model = wrap(agent.name, agent.model)
+    run_config = replace(gemini_config, model=wrap(my_agents.master_agent.name, gemini_config.model))
+
+    tool_calls = 0
+    history = []
+    started = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir, use_tenant(_prepare_bench_tenant(data_dir)):
+            for user_turn in scenario["turns"]:
+                history.append({"role": "user", "content": user_turn})
+                result = await Runner.run(
+                    starting_agent=my_agents.master_agent,
+                    input=[build_run_context()] + history,
+                    run_config=run_config,
+                )
+                tool_calls += sum(1 for item in result.new_items if isinstance(item, ToolCallItem))
+                if result.final_output:
+                    history.append({"role": "assistant", "content": result.final_output})
+    finally:
+        for agent, model in zip(sub_agents, original_models):
+            agent.model = model
+    wall_time = time.perf_counter() - started
+    if tape.exhausted:
+        raise tape.exhausted
+
+    if record:
+        os.makedirs(FIXTURES_DIR, exist_ok=True)
+        with open(fixture_file, "w") as f:
+            json.dump({"scenario": scenario["name"], "fingerprint": workflow_fingerprint(), "tapes": tape.tapes}, f, indent=2)
+
+    return {
+        "model_turns": tape.model_turns,
+        "tool_calls": tool_calls,
+        "prompt_tokens": tape.prompt_tokens,
+        "completion_tokens": tape.completion_tokens,
+        "wall_time_s": round(wall_time, 3),
+    }
+
+
+def find_regressions(name: str, current: dict, baseline: dict) -> list:
+    """Compares one scenario's metrics against its baseline."""
+    if not baseline:
+        return []
+    problems = []
+    if current["model_turns"] > baseline["model_turns"] + MAX_EXTRA_MODEL_TURNS:
+        problems.append(f"{name}: model turns {baseline['model_turns']} -> {current['model_turns']}")
+    if current["tool_calls"] > baseline["tool_calls"] + MAX_EXTRA_TOOL_CALLS:
+        problems.append(f"{name}: tool calls {baseline['tool_calls']} -> {current['tool_calls']}")
+    for metric in ("prompt_tokens", "completion_tokens"):
+        if current[metric] > baseline[metric] * (1 + MAX_TOKEN_INCREASE):
+            problems.append(f"{name}: {metric} {baseline[metric]} -> {current[metric]}")
+    allowed_wall_time = baseline["wall_time_s"] + max(baseline["wall_time_s"] * MAX_WALL_TIME_INCREASE, MIN_WALL_TIME_SLACK_S)
+    if current["wall_time_s"] > allowed_wall_time:
+        problems.append(f"{name}: wall time {baseline['wall_time_s']}s -> {current['wall_time_s']}s")
+    return problems
+
+
+async def main() -> int:
+    with open(SCENARIOS_FILE, "r") as f:
+        scenarios = [s for s in json.load(f) if not args.scenarios or s["name"] in args.scenarios]
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as f:
+            baseline = json.load(f)
+
+    mode = "RECORD" if args.record else "REPLAY"
+    lines = [f"--- HealthLine agent workflow benchmark ({mode}) ---",
+             f"{'scenario':<24}{'turns':>7}{'tools':>7}{'prompt':>9}{'compl':>8}{'wall(s)':>9}"]
+    results, regressions, failures = {}, [], []
+    for scenario in scenarios:
+        name = scenario["name"]
+        try:
+            metrics = await run_scenario(scenario, record=args.record)
+        except FileNotFoundError:
+            failures.append(f"{name}: no fixture yet, run with --record first")
+            continue
+        except (FixtureExhausted, StaleFixture) as e:
+            failures.append(f"{name}: {e}")
+            continue
+        except Exception as e:
+            # e.g. a taped call to a tool that has since been renamed; report it and carry on.
+            failures.append(f"{name}: {type(e).__name__}: {e}")
+            continue
+        results[name] = metrics
+        lines.append(f"{name:<24}{metrics['model_turns']:>7}{metrics['tool_calls']:>7}{metrics['prompt_tokens']:>9}"
+                     f"{metrics['completion_tokens']:>8}{metrics['wall_time_s']:>9.3f}")
+        regressions.extend(find_regressions(name, metrics, baseline.get(name)))
+
+    lines.extend(f"FAILED     {problem}" for problem in failures)
+    lines.extend(f"REGRESSION {problem}" for problem in regressions)
+
+    if args.update_baseline and not failures:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baseline, f, indent=2)
+        lines.append(f"Baseline updated: {BASELINE_FILE}")
+
+    report = "\n".join(lines)
+    print(report)
+    with open(OUTPUT_FILE, "w") as f:
+        f.write(report + "\n")
+    return 1 if (failures or (regressions and not args.update_baseline)) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -5,7 +5,7 @@ import os
 from agents import Runner, enable_verbose_stdout_logging, set_trace_processors, set_tracing_export_api_key, trace
 from agents.tracing.processors import default_processor
 from geminiConfig import gemini_config
-from app.my_agents import master_agent
+from app.my_agents import master_agent, build_run_context
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from .env file
@@ -47,7 +47,7 @@ async def main():
             with trace("Healthline AI - Main"):
                 result = await Runner.run(
                     starting_agent=master_agent,
-                    input=history,  # <-- We now pass the whole conversation
+                    input=[build_run_context()] + history,  # <-- We now pass the whole conversation
                     run_config=gemini_config,
                 )
 